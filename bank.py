@@ -0,0 +1,125 @@
+import logging
+from types import ModuleType
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Telegram обрізає довгі підписи кнопок на екрані, тому готуємо короткі версії заздалегідь
+BUTTON_LABEL_LIMIT = 60
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+MAX_OPTIONS = 20
+
+
+class BankError(ValueError):
+    pass
+
+
+def truncate(label: str, limit: int = BUTTON_LABEL_LIMIT) -> str:
+    return label if len(label) <= limit else label[:limit - 1].rstrip() + "…"
+
+
+# Скомпільоване питання: все, що потрібно обробникам, пораховано один раз при завантаженні
+class Question:
+    __slots__ = (
+        "qid", "sid", "category", "position", "text", "labels", "correct_mask",
+        "correct_labels", "label_lengths", "button_labels", "image",
+    )
+
+    def __init__(self, qid: int, category: str, position: int, text: str, options: Iterable[Tuple[str, bool]],
+                 image: Optional[str] = None):
+        options = tuple(options)
+        self.qid = qid
+        # Стабільний ID у межах банку (див. bankdiff.py); без реєстру збігається з позицією
+        self.sid = position
+        self.category = category
+        self.position = position
+        self.text = text
+        self.labels = tuple(label for label, _ in options)
+        self.correct_mask = sum(1 << i for i, (_, is_correct) in enumerate(options) if is_correct)
+        self.correct_labels = tuple(label for label, is_correct in options if is_correct)
+        self.label_lengths = tuple(len(label) for label in self.labels)
+        self.button_labels = tuple(truncate(label) for label in self.labels)
+        self.image = image
+
+    def __repr__(self) -> str:
+        return f"Question({self.category!r}, {self.position}, {self.text!r})"
+
+    def labels_for(self, mask: int) -> List[str]:
+        return [label for i, label in enumerate(self.labels) if mask >> i & 1]
+
+
+# Перевірка тесту: кількість правильних і список помилок у форматі сесії ({"index", "selected"})
+def check_answers(questions: Sequence[Question], masks: Sequence[int]) -> Tuple[int, List[dict]]:
+    correct = 0
+    wrongs = []
+    for i, (question, mask) in enumerate(zip(questions, masks)):
+        if question.correct_mask == mask:
+            correct += 1
+        else:
+            wrongs.append({"index": i, "selected": mask})
+    return correct, wrongs
+
+
+# Необов'язкове поле "image" — шлях до картинки відносно MEDIA_DIR; тоді текст питання стає підписом до фото
+def validate(category: str, position: int, raw) -> List[str]:
+    where = f"{category} №{position + 1}"
+    if not isinstance(raw, dict) or not isinstance(raw.get("text"), str) or not raw["text"].strip():
+        return [f"{where}: питання без тексту"]
+    errors = []
+    if len(raw["text"]) > MESSAGE_LIMIT:
+        errors.append(f"{where}: текст довший за {MESSAGE_LIMIT} символів")
+    image = raw.get("image")
+    if image is not None:
+        if not isinstance(image, str) or not image.strip():
+            errors.append(f"{where}: некоректний шлях до картинки {image!r}")
+        elif len(raw["text"]) > CAPTION_LIMIT:
+            errors.append(f"{where}: підпис до картинки довший за {CAPTION_LIMIT} символів")
+    options = raw.get("options")
+    if not options:
+        return errors + [f"{where}: немає варіантів відповіді"]
+    if len(options) > MAX_OPTIONS:
+        errors.append(f"{where}: більше {MAX_OPTIONS} варіантів")
+    for option in options:
+        if not (isinstance(option, tuple) and len(option) == 2
+                and isinstance(option[0], str) and option[0].strip() and isinstance(option[1], bool)):
+            errors.append(f"{where}: некоректний варіант {option!r}")
+    if not errors and not any(is_correct for _, is_correct in options):
+        errors.append(f"{where}: немає правильної відповіді")
+    return errors
+
+
+def compile_sections(raw_sections: Dict[str, list], first_qid: int = 0) -> Dict[str, Tuple[Question, ...]]:
+    compiled, errors = {}, []
+    qid = first_qid
+    for category, raw_questions in raw_sections.items():
+        if not raw_questions:
+            errors.append(f"{category}: розділ без питань")
+            continue
+        questions = []
+        for position, raw in enumerate(raw_questions):
+            problems = validate(category, position, raw)
+            if problems:
+                errors.extend(problems)
+                continue
+            questions.append(Question(qid, category, position, raw["text"], raw["options"], raw.get("image")))
+            qid += 1
+        compiled[category] = tuple(questions)
+    if errors:
+        raise BankError("Помилки в банку питань:\n" + "\n".join(errors))
+    return compiled
+
+
+def bank_lists(module: ModuleType) -> Dict[str, list]:
+    return {
+        name: value for name, value in vars(module).items()
+        if name.endswith("_questions") and isinstance(value, list)
+    }
+
+
+def warn_unmapped(module: ModuleType, raw_sections: Iterable[list]) -> List[str]:
+    used = {id(questions) for questions in raw_sections}
+    unmapped = [name for name, value in bank_lists(module).items() if id(value) not in used]
+    for name in unmapped:
+        logger.warning("Bank %s is not attached to any section (%d questions)", name, len(getattr(module, name)))
+    return unmapped
@@ -0,0 +1,318 @@
+import argparse
+import bisect
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from bank import Question, bank_lists
+from banklint import jaccard, load_banks, shingles
+from search import normalize
+
+# Стабільні ID питань. Кожне питання банку отримує постійний номер у межах банку (назви списку
+# в questions.py), і саме він пишеться в attempts.jsonl, history.bin і чекпоінти замість позиції.
+# Реєстр (QUESTION_IDS_PATH, за замовчуванням question_ids.json) пам'ятає для кожного номера
+# хеш вмісту питання, тож перестановка і ручні префікси "1)", "2)" номер не змінюють.
+# Коли хеш зник, а з'явився новий, різниця між версіями банку зіставляється за схожістю:
+#   редагування — нове питання схоже на зникле (Jaccard по шинглах) і успадковує його номер;
+#   розділення — кілька нових питань "вміщаються" в одне зникле: найсхожіше успадковує номер,
+#   решта отримують нові з позначкою split_from.
+# Номери ніколи не використовуються повторно, тож накопичена статистика не мігрує — лише реєстр.
+# Перший запуск роздає номери за поточними позиціями, тож уже записані дані лишаються коректними.
+#
+# Перегляд змін перед деплоєм: python bankdiff.py [--base old_questions.py] [--apply]
+
+EDIT_THRESHOLD = 0.5
+SPLIT_THRESHOLD = 0.7
+_NUMBERING = re.compile(r"^\s*\d+\s*[).]\s*")
+
+
+def content_uid(question: dict) -> str:
+    text = " ".join(normalize(_NUMBERING.sub("", question["text"])).split())
+    options = sorted(f"{int(is_correct)}{' '.join(normalize(label).split())}" for label, is_correct in question["options"])
+    return hashlib.sha256("\0".join([text] + options).encode()).hexdigest()[:16]
+
+
+# Записи, що лишились у тому самому відносному порядку (найдовша зростаюча підпослідовність старих позицій):
+# вставка чи видалення зсуває всі наступні питання, але переміщеними вважаємо лише решту
+def in_order(old_positions: Sequence[int]) -> Set[int]:
+    tails: List[int] = []
+    tail_index: List[int] = []
+    parent = [-1] * len(old_positions)
+    for i, value in enumerate(old_positions):
+        k = bisect.bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[k] = value
+            tail_index[k] = i
+        parent[i] = tail_index[k - 1] if k else -1
+    kept = set()
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        kept.add(i)
+        i = parent[i]
+    return kept
+
+
+def containment(part: FrozenSet[int], whole: FrozenSet[int]) -> float:
+    return len(part & whole) / len(part)
+
+
+class Entry:
+    __slots__ = ("id", "uid", "pos", "text", "options", "active", "split_from")
+
+    def __init__(self, id: int, uid: str, pos: int, text: str, options: list, active: bool = True,
+                 split_from: Optional[int] = None):
+        self.id = id
+        self.uid = uid
+        self.pos = pos
+        self.text = text
+        self.options = options
+        self.active = active
+        self.split_from = split_from
+
+    @classmethod
+    def from_question(cls, id: int, uid: str, pos: int, question: dict, split_from: Optional[int] = None) -> "Entry":
+        return cls(id, uid, pos, question["text"], [list(option) for option in question["options"]], True, split_from)
+
+    def as_question(self) -> dict:
+        return {"text": self.text, "options": self.options}
+
+    def to_json(self) -> dict:
+        entry = {"id": self.id, "uid": self.uid, "pos": self.pos, "text": self.text, "options": self.options}
+        if not self.active:
+            entry["active"] = False
+        if self.split_from is not None:
+            entry["split_from"] = self.split_from
+        return entry
+
+
+class Change(NamedTuple):
+    kind: str
+    id: int
+    old: Optional[Entry]
+    new_pos: Optional[int]
+    score: float = 1.0
+
+
+class BankPlan:
+    def __init__(self, bank: str, entries: List[Entry], changes: List[Change], next_id: int, bootstrap: bool = False):
+        self.bank = bank
+        self.bootstrap = bootstrap
+        # Активні записи в порядку нового банку: entries[position].id — стабільний ID питання
+        self.entries = entries
+        self.changes = changes
+        self.next_id = next_id
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for change in self.changes:
+            counts[change.kind] = counts.get(change.kind, 0) + 1
+        return counts
+
+
+class QuestionIds:
+    def __init__(self, path: str):
+        self.path = path
+        self.banks: Dict[str, Dict] = {}
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        for name, bank in config.get("banks", {}).items():
+            self.banks[name] = {
+                "next": bank["next"],
+                "entries": [
+                    Entry(e["id"], e["uid"], e["pos"], e["text"], e["options"], e.get("active", True), e.get("split_from"))
+                    for e in bank["entries"]
+                ],
+            }
+
+    def save(self) -> None:
+        config = {"banks": {
+            name: {"next": bank["next"], "entries": [entry.to_json() for entry in bank["entries"]]}
+            for name, bank in self.banks.items()
+        }}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def plan(self, bank: str, questions: Sequence[dict]) -> BankPlan:
+        uids = []
+        seen: Dict[str, int] = {}
+        for question in questions:
+            uid = content_uid(question)
+            # Точні дублікати в одному банку (banklint про них попереджає) розрізняємо за порядком
+            seen[uid] = seen.get(uid, 0) + 1
+            uids.append(uid if seen[uid] == 1 else f"{uid}~{seen[uid]}")
+
+        known = self.banks.get(bank)
+        if known is None:
+            # Банк уперше в реєстрі: номери = поточні позиції, як і в уже записаних даних
+            entries = [Entry.from_question(pos, uid, pos, q) for pos, (uid, q) in enumerate(zip(uids, questions))]
+            return BankPlan(bank, entries, [Change("added", e.id, None, e.pos) for e in entries], len(entries), True)
+
+        next_id = known["next"]
+        old_by_uid = {entry.uid: entry for entry in known["entries"] if entry.active}
+        assigned: List[Optional[Entry]] = [None] * len(questions)
+        changes: List[Change] = []
+        kept: List[Tuple[int, Entry]] = []
+        for pos, uid in enumerate(uids):
+            old = old_by_uid.pop(uid, None)
+            if old is not None:
+                assigned[pos] = Entry.from_question(old.id, uid, pos, questions[pos], old.split_from)
+                kept.append((pos, old))
+        ordered = in_order([old.pos for _, old in kept])
+        for i, (pos, old) in enumerate(kept):
+            if i not in ordered:
+                changes.append(Change("moved", old.id, old, pos))
+
+        # Решту зіставляємо лише між зниклими і новими питаннями, тож незмінені не зачіпаються
+        gone = list(old_by_uid.values())
+        fresh = [pos for pos in range(len(questions)) if assigned[pos] is None]
+        gone_sets = {entry.id: shingles(entry.as_question()) for entry in gone}
+        fresh_sets = {pos: shingles(questions[pos]) for pos in fresh}
+
+        # Редагування: жадібно від найсхожіших пар
+        pairs = sorted(
+            ((jaccard(fresh_sets[pos], gone_sets[entry.id]), pos, entry) for pos in fresh for entry in gone),
+            key=lambda pair: -pair[0],
+        )
+        used = set()
+        for score, pos, entry in pairs:
+            if score < EDIT_THRESHOLD or assigned[pos] is not None or entry.id in used:
+                continue
+            used.add(entry.id)
+            assigned[pos] = Entry.from_question(entry.id, uids[pos], pos, questions[pos], entry.split_from)
+            changes.append(Change("edited", entry.id, entry, pos, score))
+
+        # Розділення: нове питання майже повністю вміщається в зникле (або щойно відредаговане)
+        for pos in fresh:
+            if assigned[pos] is not None:
+                continue
+            best = max(
+                ((containment(fresh_sets[pos], gone_sets[entry.id]), entry) for entry in gone),
+                key=lambda pair: pair[0], default=(0.0, None),
+            )
+            score, parent = best
+            if parent is None or score < SPLIT_THRESHOLD:
+                continue
+            if parent.id not in used:
+                used.add(parent.id)
+                assigned[pos] = Entry.from_question(parent.id, uids[pos], pos, questions[pos], parent.split_from)
+                changes.append(Change("split", parent.id, parent, pos, score))
+            else:
+                assigned[pos] = Entry.from_question(next_id, uids[pos], pos, questions[pos], parent.id)
+                changes.append(Change("split", next_id, parent, pos, score))
+                next_id += 1
+
+        for pos in range(len(questions)):
+            if assigned[pos] is None:
+                assigned[pos] = Entry.from_question(next_id, uids[pos], pos, questions[pos])
+                changes.append(Change("added", next_id, None, pos))
+                next_id += 1
+        for entry in gone:
+            if entry.id not in used:
+                changes.append(Change("removed", entry.id, entry, None))
+        return BankPlan(bank, assigned, changes, next_id)
+
+    def apply(self, plan: BankPlan) -> None:
+        known = self.banks.get(plan.bank)
+        active_ids = {entry.id for entry in plan.entries}
+        retired = []
+        if known is not None:
+            for entry in known["entries"]:
+                if entry.id not in active_ids:
+                    entry.active = False
+                    retired.append(entry)
+        # Зниклі питання лишаються в реєстрі: за ними звіти показують текст старої статистики
+        self.banks[plan.bank] = {"next": plan.next_id, "entries": list(plan.entries) + retired}
+
+    def texts(self, bank: str) -> Dict[int, str]:
+        known = self.banks.get(bank)
+        return {entry.id: entry.text for entry in known["entries"]} if known else {}
+
+    def sync(self, banks: Dict[str, list], compiled: Callable[[list], Optional[Sequence[Question]]]) -> List[BankPlan]:
+        plans = []
+        for name, raw in banks.items():
+            questions = compiled(raw)
+            if questions is None:
+                continue
+            plan = self.plan(name, raw)
+            if plan.changes:
+                self.apply(plan)
+                plans.append(plan)
+            for question, entry in zip(questions, plan.entries):
+                question.sid = entry.id
+        return plans
+
+
+def load_module_banks(path: str) -> Dict[str, list]:
+    spec = importlib.util.spec_from_file_location("old_questions", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return bank_lists(module)
+
+
+def short(text: str, limit: int = 60) -> str:
+    text = " ".join(text.split())
+    return repr(text if len(text) <= limit else text[:limit - 1] + "…")
+
+
+def describe(plan: BankPlan, questions: Sequence[dict]) -> List[str]:
+    if plan.bootstrap:
+        return [f"{plan.bank}: new in registry, {len(plan.entries)} questions numbered by position"]
+    counts = ", ".join(f"{count} {kind}" for kind, count in sorted(plan.counts().items()))
+    lines = [f"{plan.bank}: {counts or 'no changes'}"]
+    for change in plan.changes:
+        if change.kind == "moved":
+            lines.append(f"  MOVED   #{change.id}: {change.old.pos + 1} -> {change.new_pos + 1} {short(questions[change.new_pos]['text'])}")
+        elif change.kind == "edited":
+            lines.append(f"  EDITED  #{change.id} ({change.score:.2f}): {short(change.old.text)} -> {short(questions[change.new_pos]['text'])}")
+        elif change.kind == "split":
+            lines.append(f"  SPLIT   #{change.old.id} -> #{change.id} at {change.new_pos + 1} ({change.score:.2f}): {short(questions[change.new_pos]['text'])}")
+        elif change.kind == "added":
+            lines.append(f"  ADDED   #{change.id} at {change.new_pos + 1}: {short(questions[change.new_pos]['text'])}")
+        else:
+            lines.append(f"  REMOVED #{change.id}: {short(change.old.text)}")
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Map stable question IDs between question bank versions")
+    parser.add_argument("--registry", default=os.getenv("QUESTION_IDS_PATH", "question_ids.json"), help="stable ID registry")
+    parser.add_argument("--base", help="older questions.py to seed banks that are not in the registry yet")
+    parser.add_argument("--apply", action="store_true", help="save the new mapping to the registry")
+    args = parser.parse_args(argv)
+
+    registry = QuestionIds(args.registry)
+    registry.load()
+    if args.base:
+        # Дані писались до появи реєстру, тож номери мають відповідати позиціям у тій, старій версії
+        for name, raw in load_module_banks(args.base).items():
+            if name not in registry.banks:
+                registry.apply(registry.plan(name, raw))
+
+    for name, raw in load_banks().items():
+        plan = registry.plan(name, raw)
+        print("\n".join(describe(plan, raw)))
+        if args.apply:
+            registry.apply(plan)
+    if args.apply:
+        registry.save()
+        print(f"Saved {args.registry}")
+    else:
+        print("Dry run: pass --apply to save the mapping")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
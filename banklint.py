@@ -0,0 +1,179 @@
+import argparse
+import os
+import sys
+import zlib
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+import questions as bank_module
+from bank import bank_lists, validate
+from search import normalize
+
+# Перевірка банків на дублікати: python banklint.py [--threshold 0.6] [--strict]
+# Точні дублікати — однаковий нормалізований текст і однаковий набір правильних відповідей
+# (дистрактори можуть відрізнятись).
+# Схожі питання — MinHash + LSH по символьних шинглах питання разом із варіантами,
+# тож шаблонні питання ("Який правильний QR-код для ...?") з різними кодами не злипаються.
+# Сигнатура рахується one-permutation hashing: один хеш на шингл, тож час лінійний від розміру банку.
+
+SHINGLE = 4
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_MASK64 = (1 << 64) - 1
+
+Ref = Tuple[str, int]
+
+
+def load_banks() -> Dict[str, list]:
+    return bank_lists(bank_module)
+
+
+def fingerprint(question: dict) -> str:
+    correct = sorted(normalize(label).strip() for label, is_correct in question["options"] if is_correct)
+    return normalize(question["text"]).strip() + "\x00" + "\x00".join(correct)
+
+
+def _hash64(chunk: str) -> int:
+    raw = chunk.encode()
+    return (zlib.crc32(raw) << 32 | zlib.crc32(raw, 0x9E3779B9)) * 0x9E3779B97F4A7C15 & _MASK64
+
+
+def shingles(question: dict) -> FrozenSet[int]:
+    parts = [question["text"]] + sorted(label for label, _ in question["options"])
+    text = " ".join(normalize(" ".join(parts)).split())
+    if len(text) <= SHINGLE:
+        return frozenset([_hash64(text)])
+    return frozenset(_hash64(text[i:i + SHINGLE]) for i in range(len(text) - SHINGLE + 1))
+
+
+def minhash(hashes: Iterable[int]) -> List[int]:
+    bins: List = [None] * NUM_PERM
+    for h in hashes:
+        slot, value = h >> 58, h & 0x03FF_FFFF_FFFF_FFFF
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    # Порожні кошики беруть значення найближчого непорожнього праворуч (densification)
+    filled = [i for i, value in enumerate(bins) if value is not None]
+    if not filled:
+        return [0] * NUM_PERM
+    signature = []
+    for i, value in enumerate(bins):
+        if value is None:
+            j = next((k for k in filled if k > i), filled[0])
+            value = bins[j] + (j - i) % NUM_PERM * 0x9E3779B9
+        signature.append(value)
+    return signature
+
+
+def jaccard(left: FrozenSet[int], right: FrozenSet[int]) -> float:
+    return len(left & right) / len(left | right)
+
+
+def find_exact_duplicates(banks: Dict[str, list]) -> List[List[Ref]]:
+    groups = defaultdict(list)
+    for name, questions in banks.items():
+        for position, question in enumerate(questions):
+            groups[fingerprint(question)].append((name, position))
+    return [refs for refs in groups.values() if len(refs) > 1]
+
+
+def find_near_duplicates(banks: Dict[str, list], threshold: float) -> List[Tuple[Ref, Ref, float]]:
+    refs: List[Ref] = []
+    sets: List[FrozenSet[int]] = []
+    buckets = defaultdict(list)
+    for name, questions in banks.items():
+        for position, question in enumerate(questions):
+            doc_id = len(refs)
+            refs.append((name, position))
+            sets.append(shingles(question))
+            signature = minhash(sets[-1])
+            for band in range(BANDS):
+                buckets[(band, tuple(signature[band * ROWS:(band + 1) * ROWS]))].append(doc_id)
+
+    candidates = set()
+    for members in buckets.values():
+        for i, left in enumerate(members):
+            for right in members[i + 1:]:
+                candidates.add((left, right))
+
+    pairs = []
+    for left, right in sorted(candidates):
+        score = jaccard(sets[left], sets[right])
+        if threshold <= score < 1.0:
+            pairs.append((refs[left], refs[right], score))
+    return pairs
+
+
+def find_duplicate_options(banks: Dict[str, list]) -> List[Tuple[Ref, str]]:
+    # Варіанти, що відрізняються лише регістром, часто навмисні ("ТОВ «AJAX»" / "ТОВ «Ajax»"),
+    # тому тут порівнюємо тільки з точністю до пробілів
+    found = []
+    for name, questions in banks.items():
+        for position, question in enumerate(questions):
+            seen = set()
+            for label, _ in question["options"]:
+                key = " ".join(label.split())
+                if key in seen:
+                    found.append(((name, position), label))
+                seen.add(key)
+    return found
+
+
+def find_missing_media(banks: Dict[str, list], media_dir: str) -> List[Tuple[Ref, str]]:
+    return [
+        ((name, position), question["image"])
+        for name, questions in banks.items()
+        for position, question in enumerate(questions)
+        if question.get("image") and not os.path.isfile(os.path.join(media_dir, question["image"]))
+    ]
+
+
+def describe(banks: Dict[str, list], ref: Ref) -> str:
+    name, position = ref
+    return f"{name}[{position}] {banks[name][position]['text']!r}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Find duplicate questions in the question banks")
+    parser.add_argument("--threshold", type=float, default=0.6, help="minimum Jaccard similarity for near-duplicates")
+    parser.add_argument("--strict", action="store_true", help="fail on near-duplicates too")
+    parser.add_argument("--media-dir", default=os.getenv("MEDIA_DIR", "media"), help="directory with question images")
+    args = parser.parse_args(argv)
+
+    banks = load_banks()
+    invalid = [
+        error for name, questions in banks.items()
+        for position, question in enumerate(questions)
+        for error in validate(name, position, question)
+    ]
+    for name, questions in banks.items():
+        if not questions:
+            print(f"EMPTY: {name}")
+    if invalid:
+        for error in invalid:
+            print(f"INVALID: {error}")
+        return 1
+
+    exact = find_exact_duplicates(banks)
+    options = find_duplicate_options(banks)
+    near = find_near_duplicates(banks, args.threshold)
+    missing = find_missing_media(banks, args.media_dir)
+
+    for refs in exact:
+        print("DUPLICATE: " + " == ".join(describe(banks, ref) for ref in refs))
+    for ref, label in options:
+        print(f"DUPLICATE OPTION: {describe(banks, ref)}: {label!r}")
+    for ref, image in missing:
+        print(f"MISSING MEDIA: {describe(banks, ref)}: {image}")
+    for left, right, score in near:
+        print(f"SIMILAR ({score:.2f}): {describe(banks, left)} ~ {describe(banks, right)}")
+
+    total = sum(len(questions) for questions in banks.values())
+    print(f"{total} questions, {len(exact)} duplicate groups, {len(options)} duplicate options, {len(near)} similar pairs")
+    failed = exact or options or missing or (args.strict and near)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
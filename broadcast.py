@@ -0,0 +1,192 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+import fileio
+from reports import counts_as_test, iter_attempts
+
+logger = logging.getLogger(__name__)
+
+# Telegram дозволяє ~30 повідомлень на секунду різним користувачам; лишаємо запас
+DEFAULT_RATE = 25
+
+
+class UserInfo:
+    __slots__ = ("user_id", "name", "passed")
+
+    def __init__(self, user_id: int, name: str):
+        self.user_id = user_id
+        self.name = name
+        self.passed: Set[str] = set()
+
+
+# Реєстр користувачів з логів тестів: хто починав (logs.txt з колонкою ID) і хто здав (attempts)
+def collect_users(log_path: str, attempts_path: str, pass_percent: int) -> Dict[int, UserInfo]:
+    users: Dict[int, UserInfo] = {}
+    if os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8") as f:
+            next(f, None)
+            for line in f:
+                parts = line.rstrip("\n").split(" | ")
+                if len(parts) >= 4 and parts[3].isdigit():
+                    user_id = int(parts[3])
+                    users.setdefault(user_id, UserInfo(user_id, f"{parts[0]} {parts[1]}"))
+    for attempt in iter_attempts(attempts_path):
+        user = users.setdefault(attempt["user_id"], UserInfo(attempt["user_id"], attempt.get("full_name", "")))
+        if attempt["percent"] >= pass_percent and counts_as_test(attempt):
+            user.passed.add(attempt["category"])
+    return users
+
+
+class BroadcastJob:
+    def __init__(self, job_id: str, text: str, targets: List[int], created: float):
+        self.job_id = job_id
+        self.text = text
+        self.targets = targets
+        self.created = created
+        self.cursor = 0
+        self.sent = 0
+        self.failures: Counter = Counter()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def failed(self) -> int:
+        return sum(self.failures.values())
+
+    def throughput(self) -> float:
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def progress(self) -> dict:
+        return {
+            "cursor": self.cursor,
+            "sent": self.sent,
+            "failures": dict(self.failures),
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+# Черга розсилок: кожна задача — незмінний файл з текстом і адресатами плюс маленький файл прогресу.
+# Перед відправкою пачки курсор зсувається і записується на диск, тож після падіння
+# пачка, що була в польоті, не відправляється вдруге (at-most-once).
+class BroadcastEngine:
+    def __init__(self, bot: Bot, directory: str = "broadcasts", rate: int = DEFAULT_RATE):
+        self.bot = bot
+        self.directory = directory
+        self.rate = rate
+        self.jobs: Dict[str, BroadcastJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.{suffix}")
+
+    async def _save_progress(self, job: BroadcastJob) -> None:
+        await fileio.write_atomic(self._path(job.job_id, "progress"), json.dumps(job.progress()))
+
+    async def create(self, text: str, targets: Iterable[int]) -> BroadcastJob:
+        job = BroadcastJob(uuid.uuid4().hex[:8], text, list(dict.fromkeys(targets)), time.time())
+        spec = json.dumps({"text": job.text, "targets": job.targets, "created": job.created}, ensure_ascii=False)
+        await fileio.run(functools.partial(os.makedirs, self.directory, exist_ok=True))
+        await fileio.write_atomic(self._path(job.job_id, "job"), spec)
+        await self._save_progress(job)
+        self.jobs[job.job_id] = job
+        return job
+
+    def load(self) -> List[BroadcastJob]:
+        if not os.path.isdir(self.directory):
+            return []
+        unfinished = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".job"):
+                continue
+            job_id = name[:-len(".job")]
+            with open(self._path(job_id, "job"), "r", encoding="utf-8") as f:
+                spec = json.load(f)
+            job = BroadcastJob(job_id, spec["text"], spec["targets"], spec["created"])
+            if os.path.exists(self._path(job_id, "progress")):
+                with open(self._path(job_id, "progress"), "r", encoding="utf-8") as f:
+                    progress = json.load(f)
+                job.cursor = progress["cursor"]
+                job.sent = progress["sent"]
+                job.failures.update(progress["failures"])
+                job.started = progress["started"]
+                job.finished = progress["finished"]
+            self.jobs[job_id] = job
+            if job.finished is None:
+                unfinished.append(job)
+        return unfinished
+
+    def start(self, job: BroadcastJob) -> None:
+        if job.job_id not in self._tasks:
+            self._tasks[job.job_id] = asyncio.create_task(self._run(job))
+
+    async def resume(self) -> None:
+        for job in await fileio.run(self.load):
+            self.start(job)
+
+    async def stop(self, timeout: float) -> None:
+        # Пачка, що вже в польоті, дописується; нові не починаються
+        self._stopping = True
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+    async def _send(self, job: BroadcastJob, chat_id: int) -> None:
+        for _ in range(3):
+            try:
+                await self.bot.send_message(chat_id, job.text)
+                job.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # Повідомлення не доставлено, тож повтор безпечний
+                await asyncio.sleep(e.retry_after)
+            except TelegramForbiddenError:
+                job.failures["blocked"] += 1
+                return
+            except Exception as e:
+                job.failures[type(e).__name__] += 1
+                return
+        job.failures["flood"] += 1
+
+    async def _run(self, job: BroadcastJob) -> None:
+        try:
+            if job.started is None:
+                job.started = time.time()
+            loop = asyncio.get_running_loop()
+            tick = loop.time()
+            while job.cursor < len(job.targets) and not self._stopping:
+                batch = job.targets[job.cursor:job.cursor + self.rate]
+                job.cursor += len(batch)
+                await self._save_progress(job)
+                await asyncio.gather(*(self._send(job, chat_id) for chat_id in batch))
+                await self._save_progress(job)
+                tick += 1
+                await asyncio.sleep(max(0.0, tick - loop.time()))
+            if self._stopping:
+                # Незавершена розсилка продовжиться з курсора в наступному інстансі
+                return
+            job.finished = time.time()
+            await self._save_progress(job)
+            logger.info(
+                "Broadcast %s finished: %d sent, %d failed, %.1f msg/s",
+                job.job_id, job.sent, job.failed, job.throughput(),
+            )
+        finally:
+            self._tasks.pop(job.job_id, None)
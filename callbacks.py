@@ -0,0 +1,53 @@
+import base64
+import binascii
+import struct
+from enum import IntEnum
+from typing import NamedTuple, Optional
+
+# Формат callback_data: версія, дія, ID питання, nonce сесії, аргумент.
+# 11 байт -> 15 символів base64, з запасом вкладається в ліміт Telegram (64 байти).
+CODEC_VERSION = 1
+_LAYOUT = struct.Struct(">BBIIB")
+
+
+class Action(IntEnum):
+    TOGGLE = 1
+    CONFIRM = 2
+    DETAILS = 3
+    RESTART = 4
+    PRACTICE = 5
+    GROUP_VOTE = 6
+    GROUP_NEXT = 7
+    GROUP_STOP = 8
+    RESULT = 9
+
+
+class CallbackPayload(NamedTuple):
+    action: Action
+    qid: int
+    nonce: int
+    arg: int
+
+
+def pack(action: Action, qid: int = 0, nonce: int = 0, arg: int = 0) -> str:
+    raw = _LAYOUT.pack(CODEC_VERSION, action, qid & 0xFFFFFFFF, nonce & 0xFFFFFFFF, arg)
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def unpack(data: Optional[str]) -> Optional[CallbackPayload]:
+    if not data or len(data) > 32:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) != _LAYOUT.size:
+        return None
+    version, action, qid, nonce, arg = _LAYOUT.unpack(raw)
+    if version != CODEC_VERSION:
+        return None
+    try:
+        action = Action(action)
+    except ValueError:
+        return None
+    return CallbackPayload(action, qid, nonce, arg)
@@ -0,0 +1,90 @@
+import bisect
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import fileio
+
+DAY = 24 * 3600
+
+CertKey = Tuple[str, int, str]
+
+
+class Certificate:
+    __slots__ = ("tenant_id", "user_id", "category", "name", "percent", "passed_at", "expires_at", "reminded")
+
+    def __init__(self, tenant_id: str, user_id: int, category: str, name: str, percent: int,
+                 passed_at: float, expires_at: float, reminded: bool = False):
+        self.tenant_id = tenant_id
+        self.user_id = user_id
+        self.category = category
+        self.name = name
+        self.percent = percent
+        self.passed_at = passed_at
+        self.expires_at = expires_at
+        self.reminded = reminded
+
+    @property
+    def key(self) -> CertKey:
+        return self.tenant_id, self.user_id, self.category
+
+
+# Здані тести з терміном дії. Поруч зі словником тримаємо відсортований за датою
+# закінчення індекс, тож "хто прострочив / в кого спливає" — це зріз через bisect, а не обхід усіх.
+# На диску — журнал подій (pass / remind), який програється під час load().
+class CertStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.certs: Dict[CertKey, Certificate] = {}
+        self.by_expiry: List[Tuple[float, CertKey]] = []
+
+    def _put(self, cert: Certificate) -> None:
+        old = self.certs.get(cert.key)
+        if old is not None:
+            i = bisect.bisect_left(self.by_expiry, (old.expires_at, old.key))
+            if i < len(self.by_expiry) and self.by_expiry[i] == (old.expires_at, old.key):
+                del self.by_expiry[i]
+        self.certs[cert.key] = cert
+        bisect.insort(self.by_expiry, (cert.expires_at, cert.key))
+
+    def _append(self, event: dict) -> None:
+        fileio.appender(self.path).write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                key = (event["tenant"], event["user_id"], event["category"])
+                if event["type"] == "pass":
+                    self._put(Certificate(*key, event["name"], event["percent"], event["passed_at"], event["expires_at"]))
+                elif event["type"] == "remind" and key in self.certs:
+                    self.certs[key].reminded = True
+
+    def record_pass(self, tenant_id: str, user_id: int, category: str, name: str, percent: int,
+                    valid_days: float, now: Optional[float] = None) -> Certificate:
+        now = now or time.time()
+        cert = Certificate(tenant_id, user_id, category, name, percent, now, now + valid_days * DAY)
+        self._put(cert)
+        self._append({
+            "type": "pass", "tenant": tenant_id, "user_id": user_id, "category": category,
+            "name": name, "percent": percent, "passed_at": cert.passed_at, "expires_at": cert.expires_at,
+        })
+        return cert
+
+    def mark_reminded(self, cert: Certificate) -> None:
+        cert.reminded = True
+        self._append({"type": "remind", "tenant": cert.tenant_id, "user_id": cert.user_id, "category": cert.category})
+
+    def expiring_between(self, start: float, end: float, tenant_id: Optional[str] = None) -> List[Certificate]:
+        lo = bisect.bisect_left(self.by_expiry, (start,))
+        hi = bisect.bisect_left(self.by_expiry, (end,))
+        certs = [self.certs[key] for _, key in self.by_expiry[lo:hi]]
+        if tenant_id is not None:
+            certs = [cert for cert in certs if cert.tenant_id == tenant_id]
+        return certs
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from aiogram.fsm.storage.base import StorageKey
+
+import fileio
+
+logger = logging.getLogger(__name__)
+
+# Поля сесії, яких достатньо, щоб відновити поточне питання
+FIELDS = (
+    "tenant", "category", "question_ids", "question_index", "selected_options", "temp_selected", "seed",
+    "exam", "deadline", "question_deadline", "full_name", "username", "ui", "message_id",
+)
+
+
+def session_key(chat_id: int, user_id: int) -> str:
+    return f"{chat_id}:{user_id}"
+
+
+# Журнал чекпоінтів: кожен рядок — дельта для однієї сесії.
+# Під час старту (load) журнал один раз програється в індекс, далі відновлення — звичайний пошук у dict.
+# Дельти накопичуються в пам'яті і скидаються на диск однією пачкою для всіх користувачів.
+# Кожен запис пам'ятає час останньої зміни ("ts"); покинуті тести старші за max_age
+# відкидаються при завантаженні й періодично під час роботи, тож індекс не росте безмежно.
+# Індекс упорядкований за "ts" (кожна зміна переносить запис у кінець), тож прострочені
+# записи завжди на початку і prune не переглядає решту.
+class Checkpointer:
+    def __init__(self, path: str, compact_ratio: int = 4, max_age: float = 7 * 24 * 3600):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.max_age = max_age
+        self.index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.pending: List[Dict[str, Any]] = []
+        self.lines = 0
+        self._lock = asyncio.Lock()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    continue  # обірваний останній рядок після аварійної зупинки
+                self.lines += 1
+        now = int(time.time())
+        for entry in self.index.values():
+            # Записи без "ts" (з попередньої версії) отримують повний термін від цього запуску
+            entry.setdefault("ts", now)
+        # Порядок у журналі — порядок змін, але старі записи щойно отримали "ts" — впорядковуємо один раз
+        self.index = OrderedDict(sorted(self.index.items(), key=lambda item: item[1]["ts"]))
+        while self.index and next(iter(self.index.values()))["ts"] < now - self.max_age:
+            self.index.popitem(last=False)
+
+    def _apply(self, delta: Dict[str, Any]) -> None:
+        key = delta["k"]
+        if delta.get("del"):
+            self.index.pop(key, None)
+            return
+        entry = self.index.setdefault(key, {})
+        self.index.move_to_end(key)
+        entry.update(delta.get("set", {}))
+        for field, tail in delta.get("app", {}).items():
+            entry[field] = entry.get(field, []) + tail
+
+    def _diff(self, old: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        changed, appended = {}, {}
+        for field in FIELDS:
+            value = data.get(field)
+            previous = old.get(field)
+            if value == previous:
+                continue
+            if isinstance(value, list) and isinstance(previous, list) and value[:len(previous)] == previous:
+                appended[field] = value[len(previous):]
+            else:
+                changed[field] = list(value) if isinstance(value, list) else value
+        delta = {}
+        if changed:
+            delta["set"] = changed
+        if appended:
+            delta["app"] = appended
+        return delta
+
+    def record(self, key: str, data: Dict[str, Any]) -> None:
+        delta = self._diff(self.index.get(key, {}), data)
+        if delta:
+            delta["k"] = key
+            delta.setdefault("set", {})["ts"] = int(time.time())
+            self._apply(delta)
+            self.pending.append(delta)
+
+    def forget(self, key: str) -> None:
+        if key in self.index:
+            del self.index[key]
+            self.pending.append({"k": key, "del": 1})
+
+    def prune(self) -> None:
+        expired = time.time() - self.max_age
+        while self.index:
+            key, entry = next(iter(self.index.items()))
+            if entry["ts"] >= expired:
+                break
+            self.forget(key)
+
+    def get(self, chat_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self.index.get(session_key(chat_id, user_id))
+        if entry is None:
+            return None
+        return {field: list(value) if isinstance(value, list) else value for field, value in entry.items() if field != "ts"}
+
+    # Хуки для SessionStorage
+    def on_write(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        skey = session_key(key.chat_id, key.user_id)
+        question_ids = data.get("question_ids")
+        if not question_ids or data.get("question_index", 0) >= len(question_ids):
+            self.forget(skey)
+        else:
+            self.record(skey, data)
+
+    def on_evict(self, key: StorageKey, record, reason: str) -> None:
+        self.on_write(key, record.data)
+
+    async def flush(self) -> None:
+        # Дельти серіалізуються в циклі подій (індекс змінюють обробники), а пишуться в пулі файлового I/O.
+        # Блокування тримає порядок: нова пачка не випередить попередню чи компакцію.
+        async with self._lock:
+            if not self.pending:
+                return
+            deltas, self.pending = self.pending, []
+            try:
+                if self.lines + len(deltas) > self.compact_ratio * len(self.index) + 100:
+                    await self.compact()
+                else:
+                    chunk = "".join(json.dumps(delta, ensure_ascii=False) + "\n" for delta in deltas)
+                    await fileio.run(_append, self.path, chunk)
+                    self.lines += len(deltas)
+            except OSError:
+                # Не втрачаємо дельти: допишемо їх наступного разу
+                self.pending[:0] = deltas
+                raise
+
+    async def compact(self) -> None:
+        text = "".join(json.dumps({"k": key, "set": entry}, ensure_ascii=False) + "\n" for key, entry in self.index.items())
+        await fileio.write_atomic(self.path, text)
+        self.lines = len(self.index)
+
+    async def run(self, interval: float = 5) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.prune()
+            try:
+                await self.flush()
+            except OSError:
+                logger.exception("Checkpoint flush failed")
+
+
+def _append(path: str, chunk: str) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(chunk)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, AnyStr, AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Уся робота з диском з корутин іде через невеликий окремий пул потоків: повільний
+# чи мережевий диск гальмує лише ці потоки, а не цикл подій. Пул свій, а не спільний
+# asyncio.to_thread, щоб завислий диск не з'їв потоки, потрібні решті коду.
+THREADS = int(os.getenv("FILE_IO_THREADS", 2))
+READ_CHUNK = 1 << 20
+# Через скільки секунд повторити запис журналу, якщо диск відмовив
+RETRY_DELAY = 5.0
+
+_executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="file-io")
+
+
+async def run(fn: Callable, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+# Журнал "тільки дописування" з коалесценцією: write() лише кладе рядок у буфер,
+# а одна фонова задача забирає все, що набралося за час попереднього запису, і пише одним write().
+# Файл тримаємо відкритим; з ним працює лише ця задача, тож одночасних записів немає.
+# Рядки — str або bytes (для бінарних журналів з opener у режимі "ab"), але в одному журналі однакові.
+# Якщо запис не вдався, рядки повертаються в буфер і задача завершується, а повтор запланований
+# через RETRY_DELAY: flush() не зависає на мертвому диску, а рядки не губляться.
+class AppendLog:
+    def __init__(self, path: str, opener: Optional[Callable[[], IO]] = None):
+        self.path = path
+        self._opener = opener or (lambda: open(path, "a", encoding="utf-8"))
+        self._buffer: List[AnyStr] = []
+        self._file: Optional[IO] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lines = 0
+        self.writes = 0
+
+    def write(self, line: AnyStr) -> None:
+        self._buffer.append(line)
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._task is None and self._buffer:
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self) -> None:
+        try:
+            while self._buffer:
+                lines, self._buffer = self._buffer, []
+                try:
+                    await run(self._write, lines[0][:0].join(lines))
+                except OSError:
+                    logger.exception("Failed to append %d lines to %s, retrying in %ss", len(lines), self.path, RETRY_DELAY)
+                    self._buffer[:0] = lines
+                    asyncio.get_running_loop().call_later(RETRY_DELAY, self._schedule)
+                    return
+                self.lines += len(lines)
+                self.writes += 1
+        finally:
+            self._task = None
+
+    def _write(self, chunk: AnyStr) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = self._opener()
+        self._file.write(chunk)
+        self._file.flush()
+
+    async def flush(self) -> None:
+        while self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._buffer:
+            logger.error("Dropping %d unwritten lines of %s", len(self._buffer), self.path)
+            self._buffer = []
+        if self._file is not None:
+            await run(self._file.close)
+            self._file = None
+
+
+_logs: Dict[str, AppendLog] = {}
+
+
+def appender(path: str, opener: Optional[Callable[[], IO]] = None) -> AppendLog:
+    # Один AppendLog на файл, щоб записи з різних обробників зливались в один буфер
+    log = _logs.get(path)
+    if log is None:
+        log = _logs[path] = AppendLog(path, opener)
+    return log
+
+
+async def flush(*paths: str) -> None:
+    await asyncio.gather(*(_logs[path].flush() for path in paths if path in _logs))
+
+
+async def close_all() -> None:
+    await asyncio.gather(*(log.close() for log in list(_logs.values())))
+
+
+def _open_for_read(path: str) -> Optional[IO]:
+    try:
+        return open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+async def read_lines(path: str) -> AsyncIterator[str]:
+    # Читання з випередженням: наступний шматок вантажиться в пулі, поки розбираємо поточний
+    f = await run(_open_for_read, path)
+    if f is None:
+        return
+    loop = asyncio.get_running_loop()
+    pending = loop.run_in_executor(_executor, f.read, READ_CHUNK)
+    try:
+        tail = ""
+        while True:
+            chunk = await pending
+            if not chunk:
+                break
+            pending = loop.run_in_executor(_executor, f.read, READ_CHUNK)
+            lines = (tail + chunk).split("\n")
+            tail = lines.pop()
+            for line in lines:
+                yield line + "\n"
+        if tail:
+            yield tail
+    finally:
+        await asyncio.wait([pending])
+        await run(f.close)
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+async def write_atomic(path: str, text: str) -> None:
+    await run(_write_atomic, path, text)
+
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from bank import Question
+
+logger = logging.getLogger(__name__)
+
+# Telegram дозволяє ~20 редагувань на хвилину в одній групі
+DEFAULT_REFRESH_INTERVAL = 3.0
+
+
+# Один тест на весь чат: усі відповідають на те саме питання, тренер перемикає питання.
+# Голоси й лічильники змінюються синхронно, без await між читанням і записом,
+# тож у межах event loop оновлення атомарні і блокування для підрахунку не потрібне.
+class GroupQuiz:
+    def __init__(self, chat_id: int, trainer_id: int, category: str, questions: Sequence[Question],
+                 nonce: int, seed: int):
+        self.chat_id = chat_id
+        self.trainer_id = trainer_id
+        self.category = category
+        self.questions = tuple(questions)
+        self.nonce = nonce
+        self.seed = seed
+        self.index = 0
+        self.closed = 0
+        self.message_id: Optional[int] = None
+        self.names: Dict[int, str] = {}
+        self.votes: Dict[int, int] = {}
+        self.counts: List[int] = [0] * len(self.questions[0].labels)
+        self.answers: Dict[int, List[int]] = {}
+        self.finished = False
+        # Стан тротлінгу: одне редагування повідомлення за інтервал, хоч би скільки було голосів
+        self.pending: Optional[asyncio.Task] = None
+        self.rendered_at = 0.0
+        self.edit_lock = asyncio.Lock()
+
+    @property
+    def question(self) -> Question:
+        return self.questions[self.index]
+
+    def vote(self, user_id: int, name: str, option: int) -> int:
+        self.names[user_id] = name
+        mask = self.votes.get(user_id, 0) ^ (1 << option)
+        self.counts[option] += 1 if mask >> option & 1 else -1
+        if mask:
+            self.votes[user_id] = mask
+        else:
+            self.votes.pop(user_id, None)
+        return mask
+
+    def close_question(self) -> None:
+        # Відповідь учасника — маска на момент закриття питання; хто не голосував, отримує 0
+        for user_id in self.votes.keys() - self.answers.keys():
+            self.answers[user_id] = [0] * self.closed
+        for user_id, answers in self.answers.items():
+            answers.append(self.votes.get(user_id, 0))
+        self.votes = {}
+        self.closed += 1
+        if self.closed == len(self.questions):
+            self.finished = True
+        else:
+            self.index += 1
+            self.counts = [0] * len(self.question.labels)
+
+    def score(self, user_id: int) -> int:
+        answers = self.answers.get(user_id, [])
+        return sum(1 for question, mask in zip(self.questions, answers) if question.correct_mask == mask)
+
+    def leaderboard(self) -> List[Tuple[str, int]]:
+        rows = [(self.names[user_id], self.score(user_id)) for user_id in self.answers]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+
+Refresh = Callable[[GroupQuiz], Awaitable[None]]
+
+
+class GroupQuizzes:
+    def __init__(self, refresh: Refresh, interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.refresh = refresh
+        self.interval = interval
+        self.by_chat: Dict[int, GroupQuiz] = {}
+        self.edits = 0
+
+    def get(self, chat_id: int, nonce: int) -> Optional[GroupQuiz]:
+        quiz = self.by_chat.get(chat_id)
+        return quiz if quiz is not None and quiz.nonce == nonce else None
+
+    def add(self, quiz: GroupQuiz) -> None:
+        self.by_chat[quiz.chat_id] = quiz
+
+    def remove(self, quiz: GroupQuiz) -> None:
+        if self.by_chat.get(quiz.chat_id) is quiz:
+            del self.by_chat[quiz.chat_id]
+        self.cancel(quiz)
+
+    def touch(self, quiz: GroupQuiz) -> None:
+        # Перший голос після паузи планує редагування, решта голосів інтервалу в нього вливаються
+        if quiz.pending is None:
+            quiz.pending = asyncio.create_task(self._flush(quiz))
+
+    def cancel(self, quiz: GroupQuiz) -> None:
+        if quiz.pending is not None:
+            quiz.pending.cancel()
+            quiz.pending = None
+
+    async def _flush(self, quiz: GroupQuiz) -> None:
+        await asyncio.sleep(max(0.0, quiz.rendered_at + self.interval - time.monotonic()))
+        async with quiz.edit_lock:
+            quiz.pending = None
+            quiz.rendered_at = time.monotonic()
+            self.edits += 1
+            try:
+                await self.refresh(quiz)
+            except Exception:
+                logger.exception("Group quiz refresh failed in chat %s", quiz.chat_id)
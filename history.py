@@ -0,0 +1,232 @@
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import fileio
+
+# Історія спроб кожного користувача в компактному бінарному вигляді.
+# Спроба: ID розділу, час (дельта від попередньої спроби того ж користувача), кількість правильних,
+# ID питань (перший + дельти, зазвичай по 1 байту) і маски відповідей — усе varint.
+# Типова спроба на 20 питань займає ~45 байт проти ~300 у attempts.jsonl.
+# У пам'яті кожен користувач — один bytearray зі спробами підряд плюс найкращий результат
+# по кожному розділу, тож "останні N" розбирає лише історію одного користувача, а "найкращі" — готові.
+#
+# Файл — журнал кадрів "varint довжини + тіло". Перший байт тіла — тип:
+#   0 — новий розділ: varint ID, "орендар\0розділ" в UTF-8;
+#   1 — спроба: varint user_id, далі байти спроби як у пам'яті.
+# Обірваний при аварії хвіст відрізається під час завантаження.
+
+FRAME_CATEGORY = 0
+FRAME_ATTEMPT = 1
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    if value < 0:
+        # Від'ємні значення кодуються через zigzag; сюди вони потрапляють лише з некоректних даних
+        raise ValueError(f"varint must be non-negative, got {value}")
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+class Attempt(NamedTuple):
+    tenant_id: str
+    category: str
+    ts: int
+    correct: int
+    total: int
+    question_ids: Tuple[int, ...]
+    masks: Tuple[int, ...]
+
+    @property
+    def percent(self) -> int:
+        return round(self.correct / self.total * 100) if self.total else 0
+
+
+def encode_attempt(out: bytearray, category_id: int, ts_delta: int, correct: int,
+                   question_ids: Sequence[int], masks: Sequence[int]) -> None:
+    write_varint(out, category_id)
+    write_varint(out, zigzag(ts_delta))
+    write_varint(out, correct)
+    write_varint(out, len(question_ids))
+    previous = 0
+    for qid in question_ids:
+        write_varint(out, zigzag(qid - previous))
+        previous = qid
+    for mask in masks:
+        write_varint(out, mask)
+
+
+# Заголовок спроби: (розділ, дельта часу, правильних, питань, позиція ID питань)
+def decode_header(data, pos: int) -> Tuple[int, int, int, int, int]:
+    category_id, pos = read_varint(data, pos)
+    ts_delta, pos = read_varint(data, pos)
+    correct, pos = read_varint(data, pos)
+    total, pos = read_varint(data, pos)
+    return category_id, unzigzag(ts_delta), correct, total, pos
+
+
+# Уся спроба: (розділ, дельта часу, правильних, ID питань, маски, позиція наступної спроби)
+def decode_attempt(data, pos: int) -> Tuple[int, int, int, Tuple[int, ...], Tuple[int, ...], int]:
+    category_id, ts_delta, correct, total, pos = decode_header(data, pos)
+    question_ids = []
+    qid = 0
+    for _ in range(total):
+        delta, pos = read_varint(data, pos)
+        qid += unzigzag(delta)
+        question_ids.append(qid)
+    masks = []
+    for _ in range(total):
+        mask, pos = read_varint(data, pos)
+        masks.append(mask)
+    return category_id, ts_delta, correct, tuple(question_ids), tuple(masks), pos
+
+
+class UserHistory:
+    __slots__ = ("data", "count", "last_ts", "best")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.count = 0
+        self.last_ts = 0
+        # ID розділу -> (правильних, всього, час) найкращої спроби
+        self.best: Dict[int, Tuple[int, int, int]] = {}
+
+    def add(self, category_id: int, ts: int, correct: int, total: int, payload: bytes) -> None:
+        self.data += payload
+        self.count += 1
+        self.last_ts = ts
+        best = self.best.get(category_id)
+        # Частки порівнюємо без ділення; при рівності перемагає свіжіша спроба
+        if best is None or correct * best[1] >= best[0] * total:
+            self.best[category_id] = (correct, total, ts)
+
+
+class HistoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.users: Dict[int, UserHistory] = {}
+        self.categories: List[Tuple[str, str]] = []
+        self.category_ids: Dict[Tuple[str, str], int] = {}
+        self.attempts = 0
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos < len(data):
+            try:
+                length, start = read_varint(data, pos)
+            except IndexError:
+                break
+            end = start + length
+            if end > len(data):
+                break
+            self._apply(memoryview(data)[start:end])
+            pos = end
+        if pos < len(data):
+            # Запис обірвався посеред кадру — відрізаємо, щоб наступні кадри лягли рівно
+            with open(self.path, "r+b") as f:
+                f.truncate(pos)
+
+    def _apply(self, frame) -> None:
+        if frame[0] == FRAME_CATEGORY:
+            category_id, pos = read_varint(frame, 1)
+            tenant_id, _, category = bytes(frame[pos:]).decode("utf-8").partition("\0")
+            self._define(category_id, tenant_id, category)
+            return
+        user_id, pos = read_varint(frame, 1)
+        # На старті вистачає заголовка: питання й маски розбираються лише на запит історії
+        category_id, ts_delta, correct, total, _ = decode_header(frame, pos)
+        user = self.user(user_id)
+        user.add(category_id, user.last_ts + ts_delta, correct, total, bytes(frame[pos:]))
+        self.attempts += 1
+
+    def _define(self, category_id: int, tenant_id: str, category: str) -> None:
+        while len(self.categories) <= category_id:
+            self.categories.append(("", ""))
+        self.categories[category_id] = (tenant_id, category)
+        self.category_ids[tenant_id, category] = category_id
+
+    def user(self, user_id: int) -> UserHistory:
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = UserHistory()
+        return user
+
+    def _frame(self, body: bytearray) -> bytes:
+        out = bytearray()
+        write_varint(out, len(body))
+        return bytes(out + body)
+
+    def add(self, tenant_id: str, user_id: int, category: str, ts: int, correct: int,
+            question_ids: Sequence[int], masks: Sequence[int]) -> None:
+        log = fileio.appender(self.path, lambda: open(self.path, "ab"))
+        category_id = self.category_ids.get((tenant_id, category))
+        if category_id is None:
+            category_id = len(self.categories)
+            self._define(category_id, tenant_id, category)
+            body = bytearray([FRAME_CATEGORY])
+            write_varint(body, category_id)
+            body += f"{tenant_id}\0{category}".encode("utf-8")
+            log.write(self._frame(body))
+
+        masks = list(masks[:len(question_ids)]) + [0] * (len(question_ids) - len(masks))
+        user = self.user(user_id)
+        payload = bytearray()
+        encode_attempt(payload, category_id, ts - user.last_ts, correct, question_ids, masks)
+        user.add(category_id, ts, correct, len(question_ids), bytes(payload))
+        self.attempts += 1
+        body = bytearray([FRAME_ATTEMPT])
+        write_varint(body, user_id)
+        log.write(self._frame(body + payload))
+
+    def _iter(self, user: UserHistory) -> Iterator[Attempt]:
+        pos = ts = 0
+        while pos < len(user.data):
+            category_id, ts_delta, correct, question_ids, masks, pos = decode_attempt(user.data, pos)
+            ts += ts_delta
+            tenant_id, category = self.categories[category_id]
+            yield Attempt(tenant_id, category, ts, correct, len(question_ids), question_ids, masks)
+
+    def last(self, user_id: int, n: int, tenant_id: Optional[str] = None) -> List[Attempt]:
+        user = self.users.get(user_id)
+        if user is None:
+            return []
+        attempts = [a for a in self._iter(user) if tenant_id is None or a.tenant_id == tenant_id]
+        return attempts[:-n - 1:-1]
+
+    def best(self, user_id: int, tenant_id: Optional[str] = None) -> Dict[str, Tuple[int, int, int]]:
+        user = self.users.get(user_id)
+        if user is None:
+            return {}
+        result = {}
+        for category_id, best in user.best.items():
+            owner, category = self.categories[category_id]
+            if tenant_id is None or owner == tenant_id:
+                result[category] = best
+        return result
+
+    def size(self) -> int:
+        return sum(len(user.data) for user in self.users.values())
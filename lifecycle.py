@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from typing import IO, Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, Update
+
+import fileio
+
+try:
+    import fcntl
+except ImportError:  # Windows: лише для локальної розробки, передачі інстансів там немає
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Життєвий цикл інстансу бота.
+# Зупинка (SIGTERM): aiogram перестає брати апдейти, ми чекаємо на обробники, що вже працюють,
+# скидаємо журнали й чекпоінти, підтверджуємо Telegram offset останнього апдейту і звільняємо lock.
+# Передача: lock-файл тримається через flock, який ядро знімає й зі смертю процесу. Новий інстанс
+# читає з файлу pid власника, шле йому SIGTERM, чекає на flock і лише тоді вантажить стан і починає
+# polling. Разом з pid у файлі лежить час старту процесу: сигнал іде, лише якщо він збігся, тож
+# процес, що випадково отримав той самий pid, не постраждає. Offset з файлу передачі відсікає апдейти,
+# які старий інстанс уже обробив, тож нічого не обробляється двічі.
+
+HANDOVER_TIMEOUT = 60
+HANDOVER_POLL = 0.2
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_start(pid: int) -> Optional[str]:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime — 22-ге поле; рахуємо після назви процесу в дужках, бо в ній бувають пробіли
+    return stat.rpartition(b")")[2].split()[19].decode()
+
+
+# Чи lock справді тримає процес, записаний у файлі (а не інший, що успадкував його pid)
+def is_holder(lock: Optional[Dict[str, Any]]) -> bool:
+    pid = lock.get("pid") if lock else None
+    if not pid or pid == os.getpid():
+        return False
+    start = process_start(pid)
+    return start == lock.get("start") if start is not None else pid_alive(pid)
+
+
+def _open_lock(path: str) -> IO:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return open(path, "a+", encoding="utf-8")
+
+
+def _try_lock(f: IO) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+# Пишемо в той самий файл, а не через заміну: flock прив'язаний до inode
+def _write_lock(f: IO, content: str) -> None:
+    f.seek(0)
+    f.truncate()
+    f.write(content)
+    f.flush()
+
+
+class Lifecycle(BaseMiddleware):
+    def __init__(self, lock_path: str, offset_path: str, drain_timeout: float):
+        self.lock_path = lock_path
+        self.offset_path = offset_path
+        self.drain_timeout = drain_timeout
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.draining = False
+        self.last_update_id: Optional[int] = None
+        self.min_update_id = 0
+        self.duplicates = 0
+        self._lock_file: Optional[IO] = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.update_id < self.min_update_id:
+            # Попередній інстанс уже обробив цей апдейт, але Telegram віддав його знову
+            self.duplicates += 1
+            return None
+        if self.last_update_id is None or event.update_id > self.last_update_id:
+            self.last_update_id = event.update_id
+        self.in_flight += 1
+        self.idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self.idle.set()
+
+    async def acquire(self, bot: Bot) -> None:
+        self._lock_file = await fileio.run(_open_lock, self.lock_path)
+        signalled = None
+        deadline = 0.0
+        while not _try_lock(self._lock_file):
+            lock = await fileio.run(_read_json, self.lock_path)
+            # Власник щойно взяв lock і ще не записав себе у файл — просто чекаємо
+            if is_holder(lock):
+                pid = lock["pid"]
+                if pid != signalled:
+                    logger.info("Taking over from instance %s", pid)
+                    os.kill(pid, signal.SIGTERM)
+                    signalled = pid
+                    deadline = time.monotonic() + HANDOVER_TIMEOUT
+                elif time.monotonic() > deadline:
+                    logger.warning("Instance %s did not release the lock in %ss, killing it", pid, HANDOVER_TIMEOUT)
+                    os.kill(pid, signal.SIGKILL)
+                    deadline = time.monotonic() + HANDOVER_TIMEOUT
+            await asyncio.sleep(HANDOVER_POLL)
+
+        handed = await fileio.run(_read_json, self.offset_path)
+        # Номери апдейтів свої в кожного бота, тож чужий offset (після зміни токена) ігноруємо
+        if handed and handed.get("bot_id") == bot.id:
+            self.min_update_id = handed["offset"]
+        lock = json.dumps({"pid": os.getpid(), "start": process_start(os.getpid()), "started": time.time()})
+        await fileio.run(_write_lock, self._lock_file, lock)
+
+    async def drain(self) -> bool:
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.idle.wait(), self.drain_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def release(self, bot: Bot) -> None:
+        if self.last_update_id is not None:
+            offset = self.last_update_id + 1
+            # Polling підтверджує апдейти лише наступним getUpdates, тож робимо його самі,
+            # інакше новий інстанс отримав би останню пачку ще раз
+            try:
+                await bot.get_updates(offset=offset, limit=1, timeout=0)
+            except Exception:
+                logger.exception("Failed to confirm update offset %s", offset)
+            await fileio.write_atomic(self.offset_path, json.dumps({"bot_id": bot.id, "offset": offset}))
+        # Файл не видаляємо: інстанс, що вже чекає на flock, тримає відкритим саме цей inode
+        if self._lock_file is not None:
+            await fileio.run(_write_lock, self._lock_file, "")
+            await fileio.run(self._lock_file.close)
+            self._lock_file = None
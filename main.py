@@ -1,221 +1,762 @@
+from startup import StartupProfiler
+
+profiler = StartupProfiler.from_env()
+
 import asyncio
+import functools
+import json
+import logging
+import multiprocessing
 import os
+import shutil
+import tempfile
 import random
+import time
+from urllib.parse import urlencode
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from flask import Flask
-from threading import Thread
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent, FSInputFile, InputMediaPhoto
+from aiogram.types import BufferedInputFile, WebAppInfo
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
+import questions as bank_module
 from questions import op_questions, general_questions, lean_questions, qr_questions
+from bank import MESSAGE_LIMIT, bank_lists, check_answers, truncate, warn_unmapped
+from tenants import Tenant, TenantMiddleware, TenantRegistry
+from callbacks import Action, CallbackPayload, pack, unpack
+from sessions import SessionStorage
+from checkpoints import Checkpointer
+from timers import TimerScheduler
+from search import SearchIndex, tokenize
+from practice import InlinePractice, CACHE_TIME
+from packs import PracticePacks
+from webquiz import WebQuiz, WebSubmission
+import fileio
+import reports
+import render
+from broadcast import BroadcastEngine, collect_users
+from certs import DAY, CertStore
+from history import HistoryStore
+from bankdiff import QuestionIds
+from replay import UpdateRecorder
+from media import MediaCache
+from groups import GroupQuiz, GroupQuizzes
+from profiling import ProfileSession
+from lifecycle import Lifecycle
+from traffic import ApiCallMeter, ApiCallOwner
+import web
 
-load_dotenv()
+with profiler.phase("load_dotenv"):
+    load_dotenv()
 TOKEN = os.getenv("token")
 
-bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+with profiler.phase("bot + dispatcher"):
+    bot = Bot(token=TOKEN)
+    checkpointer = Checkpointer(
+        os.getenv("CHECKPOINT_PATH", "checkpoints.log"),
+        max_age=float(os.getenv("CHECKPOINT_MAX_AGE_DAYS", 7)) * 24 * 3600,
+    )
+    storage = SessionStorage(
+        ttl=float(os.getenv("SESSION_TTL", 6 * 3600)),
+        max_sessions=int(os.getenv("SESSION_MAX", 10_000)),
+        memory_budget=int(float(os.getenv("SESSION_MEMORY_MB", 64)) * 1024 * 1024),
+        on_evict=checkpointer.on_evict,
+        on_write=checkpointer.on_write,
+    )
+    dp = Dispatcher(storage=storage)
+    # Першим серед middleware: відкидає вже оброблені апдейти і рахує ті, що в роботі
+    lifecycle = Lifecycle(
+        os.getenv("INSTANCE_LOCK", "bot.lock"),
+        os.getenv("OFFSET_PATH", "offset.json"),
+        float(os.getenv("SHUTDOWN_TIMEOUT", 25)),
+    )
+    dp.update.outer_middleware(lifecycle)
+    api_calls = ApiCallMeter()
+    bot.session.middleware(api_calls)
+    dp.update.outer_middleware(ApiCallOwner(api_calls))
+
+# Власник бота: адмін орендаря за замовчуванням і єдиний, хто бачить статистику процесу
+ADMIN_ID = int(os.getenv("ADMIN_ID", 710633503))
+
+# Мінімальний результат, з яким тест вважається зданим (оцінка "Добре")
+PASS_PERCENT = 70
 
-ADMIN_ID = 710633503
+# Скільки діє зданий тест і за скільки днів до кінця нагадувати
+CERT_VALID_DAYS = float(os.getenv("CERT_VALID_DAYS", 365))
+CERT_REMIND_DAYS = float(os.getenv("CERT_REMIND_DAYS", 14))
 
-if not os.path.exists("logs.txt"):
-    with open("logs.txt", "w", encoding="utf-8") as f:
-        f.write("FullName | Username | Дія\n")
+# Скільки питань розділу (по порядку) входить у тест
+QUIZ_SIZE = 20
 
-app = Flask(__name__)
+EXAM_QUESTION_SECONDS = int(os.getenv("EXAM_QUESTION_SECONDS", 60))
+EXAM_TOTAL_SECONDS = int(os.getenv("EXAM_TOTAL_SECONDS", 15 * 60))
 
-@app.route("/")
-def home():
-    return "Bot is running!"
+# Інтерфейс тесту: "classic" — результат і кожна помилка в деталях окремими повідомленнями,
+# "single" — весь тест (питання, результат, деталі посторінково) в одному повідомленні, що редагується
+UI_CLASSIC = "classic"
+UI_SINGLE = "single"
+QUIZ_UI = os.getenv("QUIZ_UI", UI_CLASSIC)
 
-@app.route("/ping")
-def ping():
-    return "OK", 200
+# Картинки до питань (поле "image" в банку) і кеш їхніх file_id
+MEDIA_DIR = os.getenv("MEDIA_DIR", "media")
+media = MediaCache(os.getenv("MEDIA_CACHE_PATH", "media_cache.jsonl"))
 
-Thread(target=lambda: app.run(host="0.0.0.0", port=8080)).start()
+# Компактна історія спроб кожного користувача для /history
+history = HistoryStore(os.getenv("HISTORY_PATH", "history.bin"))
+
+def ensure_log_files():
+    for tenant in tenants.tenants.values():
+        if not os.path.exists(tenant.log_path):
+            os.makedirs(os.path.dirname(tenant.log_path) or ".", exist_ok=True)
+            with open(tenant.log_path, "w", encoding="utf-8") as f:
+                f.write("FullName | Username | Дія | ID\n")
 
 class QuizState(StatesGroup):
     category = State()
     question_index = State()
     selected_options = State()
 
-sections = {
+raw_sections = {
     "👮ОП👮": op_questions,
     "🎭Загальні🎭": general_questions,
     "🗿LEAN🗿": lean_questions,
     "🎲QR🎲": qr_questions,
 }
 
-def main_keyboard():
-    buttons = [types.KeyboardButton(text=section) for section in sections]
+with profiler.phase("compile question banks"):
+    tenants = TenantRegistry()
+    tenants.add(Tenant("default", tenants.compile(raw_sections), [ADMIN_ID], "logs.txt", "attempts.jsonl"), default=True)
+    tenants.load(os.getenv("TENANTS_PATH", "tenants.json"), bank_lists(bank_module))
+    warn_unmapped(bank_module, tenants.raw_banks())
+    dp.update.outer_middleware(TenantMiddleware(tenants))
+
+# Стабільні ID питань: у журналах і історії питання лишаються тими самими після правок банку.
+# Реєстр вантажиться в main(); до того sid питання дорівнює його позиції.
+stable_ids = QuestionIds(os.getenv("QUESTION_IDS_PATH", "question_ids.json"))
+# Скомпільований розділ -> назва банку в реєстрі
+bank_names = {}
+for name, raw in bank_lists(bank_module).items():
+    compiled = tenants.compiled(raw)
+    if compiled is not None:
+        bank_names[id(compiled)] = name
+
+def sync_question_ids():
+    stable_ids.load()
+    bank_changes = stable_ids.sync(bank_lists(bank_module), tenants.compiled)
+    for plan in bank_changes:
+        logging.info("Question bank %s changed: %s", plan.bank, plan.counts())
+    if bank_changes:
+        stable_ids.save()
+
+# Запис анонімізованого потоку апдейтів для replay.py (вимкнено, поки не задано RECORD_UPDATES)
+recorder = None
+if os.getenv("RECORD_UPDATES"):
+    salt = os.getenv("RECORD_SALT")
+    keep = {ADMIN_ID, *tenants.by_chat}
+    for tenant in tenants.tenants.values():
+        keep.update(tenant.admins)
+    recorder = UpdateRecorder(os.environ["RECORD_UPDATES"], salt.encode() if salt else None, keep)
+    dp.update.outer_middleware(recorder)
+
+sections = tenants.default.sections
+
+@functools.lru_cache(maxsize=None)
+def questions_by_sid(tenant: Tenant, category: str):
+    return {q.sid: q for q in tenant.sections[category]}
+
+# Тексти для звіту: статистика зібрана за стабільними ID, тож видалені питання теж отримують підпис
+def question_texts_for(tenant: Tenant, category: str):
+    questions = tenant.sections[category]
+    texts = {sid: (None, f"(видалено) {text}") for sid, text in stable_ids.texts(bank_names.get(id(questions), "")).items()}
+    texts.update((q.sid, (q.position + 1, q.text)) for q in questions)
+    return texts
+
+# Орендар тесту фіксується на старті: у приватному чаті for_chat залежить від групи, де користувач
+# писав востаннє, а питання сесії мають братися з того самого банку до кінця тесту.
+# Сесії й чекпоінти без поля "tenant" записані до його появи — для них лишається пошук за чатом.
+def quiz_tenant(state: FSMContext, data) -> Tenant:
+    tenant_id = data.get("tenant")
+    if tenant_id is None:
+        return tenants.for_chat(state.key.chat_id, state.key.user_id)
+    return tenants.tenants[tenant_id]
+
+def session_questions(data, tenant: Tenant):
+    bank = questions_by_sid(tenant, data["category"])
+    return [bank[i] for i in data["question_ids"]]
+
+@functools.lru_cache(maxsize=None)
+def main_keyboard(tenant: Tenant):
+    buttons = [types.KeyboardButton(text=section) for section in tenant.sections]
     keyboard = types.ReplyKeyboardMarkup(
         keyboard=[[button] for button in buttons],
         resize_keyboard=True
     )
     return keyboard
 
-@dp.message(F.text.in_(sections.keys()))
-async def start_quiz(message: types.Message, state: FSMContext):
-    category = message.text
-    questions = sections[category][:20]  # Питання по порядку, без shuffle
-    await state.set_state(QuizState.category)
-    await state.update_data(category=category, question_index=0, selected_options=[], wrong_answers=[], questions=questions)
+def is_section(message: types.Message, tenant: Tenant):
+    return message.text in tenant.sections
 
-    full_name = message.from_user.full_name
-    username = message.from_user.username or "немає"
+def next_deadline(data):
+    deadlines = [d for d in (data.get("deadline"), data.get("question_deadline")) if d]
+    return min(deadlines) if deadlines else None
 
-    with open("logs.txt", "a", encoding="utf-8") as f:
-        f.write(f"{full_name} | @{username} | Почав тест {category}\n")
+def arm_timer(chat_id, user_id, data):
+    when = next_deadline(data)
+    if when is None:
+        timers.cancel((chat_id, user_id))
+    else:
+        timers.schedule((chat_id, user_id), when)
 
-    try:
-        await bot.send_message(ADMIN_ID, f"👤 {full_name} (@{username}) почав тест {category}")
-    except:
-        pass
+def format_seconds(seconds):
+    seconds = max(0, int(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
 
+def format_date(timestamp):
+    return time.strftime("%d.%m.%Y", time.localtime(timestamp))
+
+@dp.message(is_section)
+async def start_quiz(message: types.Message, state: FSMContext, tenant: Tenant):
+    exam = (await state.get_data()).get("exam_pending", False)
+    await begin_quiz(state, tenant, message.from_user, message.text, exam)
     await send_question(message, state)
 
-async def send_question(message_or_callback, state: FSMContext):
+async def begin_quiz(state: FSMContext, tenant: Tenant, user: types.User, category: str, exam: bool = False):
+    question_ids = [q.sid for q in tenant.sections[category][:QUIZ_SIZE]]  # Питання по порядку, без shuffle
+    await state.set_state(QuizState.category)
+    nonce = random.getrandbits(32)
+    seed = random.getrandbits(32)
+    full_name = user.full_name
+    username = user.username or "немає"
+    data = dict(tenant=tenant.tenant_id, category=category, question_index=0, selected_options=[], temp_selected=0, wrong_answers=[], question_ids=question_ids, nonce=nonce, seed=seed, exam=exam, full_name=full_name, username=username, ui=QUIZ_UI)
+    if exam:
+        now = time.time()
+        data.update(deadline=now + EXAM_TOTAL_SECONDS, question_deadline=now + EXAM_QUESTION_SECONDS)
+        arm_timer(state.key.chat_id, user.id, data)
+    api_calls.start((state.key.chat_id, user.id))
+    await state.set_data(data)
+
+    fileio.appender(tenant.log_path).write(f"{full_name} | @{username} | Почав тест {category} | {user.id}\n")
+
+    with api_calls.untracked():
+        for admin_id in tenant.admins:
+            try:
+                await bot.send_message(admin_id, f"👤 {full_name} (@{username}) почав тест {category}")
+            except:
+                pass
+
+def record_attempt(tenant: Tenant, user_id: int, data: dict, correct: int, percent: int, wrongs: list, masks: list,
+                   mode: str = "quiz"):
+    attempt = {
+        "ts": int(time.time()),
+        "user_id": user_id,
+        "full_name": data.get("full_name", ""),
+        "username": data.get("username", ""),
+        "category": data["category"],
+        "correct": correct,
+        "total": len(data["question_ids"]),
+        "percent": percent,
+        "asked": data["question_ids"],
+        "failed": [data["question_ids"][item["index"]] for item in wrongs],
+        "mode": mode,
+    }
+    fileio.appender(tenant.attempts_path).write(json.dumps(attempt, ensure_ascii=False) + "\n")
+    history.add(tenant.tenant_id, user_id, data["category"], attempt["ts"], correct, data["question_ids"], masks)
+
+def result_keyboard(nonce):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔁 Пройти ще раз", callback_data=pack(Action.RESTART, nonce=nonce))],
+        [InlineKeyboardButton(text="📋 Детальна інформація", callback_data=pack(Action.DETAILS, nonce=nonce))]
+    ])
+
+async def send_question(message_or_callback, state: FSMContext, notice: str = ""):
     data = await state.get_data()
-    questions = data["questions"]
+    tenant = quiz_tenant(state, data)
+    questions = session_questions(data, tenant)
     index = data["question_index"]
+    single = data.get("ui") == UI_SINGLE
+    lead = notice + "\n\n" if notice else ""
 
     if index >= len(questions):
-        correct = 0
-        wrongs = []
-        for i, q in enumerate(questions):
-            correct_answers = {j for j, (_, is_correct) in enumerate(q["options"]) if is_correct}
-            user_selected = set(data["selected_options"][i])
-            if correct_answers == user_selected:
-                correct += 1
-            else:
-                wrongs.append({
-                    "question": q["text"],
-                    "options": q["options"],
-                    "selected": list(user_selected),
-                    "correct": list(correct_answers)
-                })
+        correct, wrongs = check_answers(questions, data["selected_options"])
 
-        await state.update_data(wrong_answers=wrongs)
+        await state.update_data(wrong_answers=wrongs, deadline=None, question_deadline=None)
+        if data.get("exam"):
+            timers.cancel((state.key.chat_id, state.key.user_id))
 
         percent = round(correct / len(questions) * 100)
-        grade = "❌ Погано"
-        if percent >= 90:
-            grade = "💯 Відмінно"
-        elif percent >= 70:
-            grade = "👍 Добре"
-        elif percent >= 50:
-            grade = "👌 Задовільно"
-
-        result = (
-            "📊 *Результат тесту:*\n\n"
-            f"✅ *Правильних відповідей:* {correct} з {len(questions)}\n"
-            f"📈 *Успішність:* {percent}%\n"
-            f"🏆 *Оцінка:* {grade}"
+        record_attempt(
+            tenant, state.key.user_id, data, correct, percent, wrongs, data["selected_options"],
+            "exam" if data.get("exam") else "quiz",
         )
+        cert = None
+        if percent >= PASS_PERCENT:
+            cert = certs.record_pass(
+                tenant.tenant_id, state.key.user_id, data["category"],
+                f"{data.get('full_name', '')} @{data.get('username', '')}", percent, CERT_VALID_DAYS
+            )
+        valid_until = format_date(cert.expires_at) if cert is not None else None
+        result = render.result(correct, len(questions), percent, valid_until)
+        keyboard = result_keyboard(data["nonce"])
 
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔁 Пройти ще раз", callback_data="restart")],
-            [InlineKeyboardButton(text="📋 Детальна інформація", callback_data="details")]
-        ])
-
-        if isinstance(message_or_callback, CallbackQuery):
+        if single:
+            # Результат займає місце питання; текст зберігаємо, щоб повертатись до нього з деталей
+            await state.update_data(result_text=result)
+            await show_text(message_or_callback, state, lead + result, keyboard, parse_mode="Markdown")
+        elif isinstance(message_or_callback, CallbackQuery):
             await message_or_callback.message.answer(result, reply_markup=keyboard, parse_mode="Markdown")
+        elif isinstance(message_or_callback, int):
+            await bot.send_message(message_or_callback, result, reply_markup=keyboard, parse_mode="Markdown")
         else:
             await message_or_callback.answer(result, reply_markup=keyboard, parse_mode="Markdown")
+        api_calls.finish((state.key.chat_id, state.key.user_id), data.get("ui", UI_CLASSIC))
 
         return
 
     question = questions[index]
-    text = question["text"]
-    options = list(enumerate(question["options"]))
-    random.shuffle(options)
+    text = lead + question.text
+    if data.get("deadline"):
+        now = time.time()
+        text += (
+            f"\n\n⏱ На питання: {format_seconds(data['question_deadline'] - now)}"
+            f" · До кінця іспиту: {format_seconds(data['deadline'] - now)}"
+        )
+    options = list(enumerate(question.button_labels))
+    # Порядок варіантів залежить лише від seed сесії, тож не стрибає між натисканнями і відновлюється з чекпоінта
+    random.Random(data["seed"] + index).shuffle(options)
 
-    selected = data.get("temp_selected", set())
+    selected = data.get("temp_selected", 0)
+    nonce = data["nonce"]
     buttons = []
-    for i, (label, _) in options:
-        prefix = "✅ " if i in selected else "◻️ "
-        buttons.append([InlineKeyboardButton(text=prefix + label, callback_data=f"opt_{i}")])
-    buttons.append([InlineKeyboardButton(text="✅ Підтвердити", callback_data="confirm")])
+    for i, label in options:
+        prefix = "✅ " if selected >> i & 1 else "◻️ "
+        buttons.append([InlineKeyboardButton(text=prefix + label, callback_data=pack(Action.TOGGLE, index, nonce, i))])
+    buttons.append([InlineKeyboardButton(text="✅ Підтвердити", callback_data=pack(Action.CONFIRM, index, nonce))])
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    if question.image is not None:
+        await send_photo_question(message_or_callback, state, os.path.join(MEDIA_DIR, question.image), text, keyboard)
+    else:
+        await show_text(message_or_callback, state, text, keyboard)
+
+async def show_text(message_or_callback, state: FSMContext, text, keyboard, parse_mode=None):
     if isinstance(message_or_callback, CallbackQuery):
-        await message_or_callback.message.edit_text(text, reply_markup=keyboard)
+        message = message_or_callback.message
+        if not message.photo:
+            await message.edit_text(text, reply_markup=keyboard, parse_mode=parse_mode)
+            return
+        # Фото не можна відредагувати в текст — замінюємо повідомлення
+        await message.delete()
+        sent = await message.answer(text, reply_markup=keyboard, parse_mode=parse_mode)
+    elif isinstance(message_or_callback, int):
+        await drop_quiz_message(message_or_callback, state)
+        sent = await bot.send_message(message_or_callback, text, reply_markup=keyboard, parse_mode=parse_mode)
     else:
-        await message_or_callback.answer(text, reply_markup=keyboard)
+        await drop_quiz_message(message_or_callback.chat.id, state)
+        sent = await message_or_callback.answer(text, reply_markup=keyboard, parse_mode=parse_mode)
+    await state.update_data(message_id=sent.message_id)
 
-@dp.callback_query(F.data.startswith("opt_"))
-async def toggle_option(callback: CallbackQuery, state: FSMContext):
-    index = int(callback.data.split("_")[1])
+async def drop_quiz_message(chat_id, state: FSMContext):
+    # В режимі одного повідомлення нове повідомлення тесту (таймер, /resume) замінює попереднє
     data = await state.get_data()
-    selected = data.get("temp_selected", set())
-    if index in selected:
-        selected.remove(index)
+    if data.get("ui") != UI_SINGLE or not data.get("message_id"):
+        return
+    try:
+        await bot.delete_message(chat_id, data["message_id"])
+    except TelegramBadRequest:
+        # Уже видалене або старше 48 годин — лишаємо як є
+        pass
+
+async def send_photo_question(message_or_callback, state: FSMContext, path, caption, keyboard):
+    if isinstance(message_or_callback, CallbackQuery):
+        message = message_or_callback.message
+        if message.photo:
+            # Між фото-питаннями (і при перемиканні варіантів) — один edit_media за кешованим file_id
+            await media.send(path, lambda photo: message.edit_media(
+                InputMediaPhoto(media=photo, caption=caption), reply_markup=keyboard
+            ))
+            return
+        await message.delete()
+        chat_id = message.chat.id
+    elif isinstance(message_or_callback, int):
+        chat_id = message_or_callback
+        await drop_quiz_message(chat_id, state)
     else:
-        selected.add(index)
+        chat_id = message_or_callback.chat.id
+        await drop_quiz_message(chat_id, state)
+    sent = await media.send(path, lambda photo: bot.send_photo(chat_id, photo, caption=caption, reply_markup=keyboard))
+    if isinstance(sent, types.Message):
+        await state.update_data(message_id=sent.message_id)
+
+async def toggle_option(callback: CallbackQuery, state: FSMContext, data: dict, payload: CallbackPayload):
+    selected = data.get("temp_selected", 0) ^ (1 << payload.arg)
     await state.update_data(temp_selected=selected)
     await send_question(callback, state)
 
-@dp.callback_query(F.data == "confirm")
-async def confirm_answer(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    selected = data.get("temp_selected", set())
-    selected_options = data.get("selected_options", [])
-    selected_options.append(list(selected))
-    await state.update_data(
-        selected_options=selected_options,
+async def record_answer(state: FSMContext, data: dict):
+    changes = dict(
+        selected_options=data.get("selected_options", []) + [data.get("temp_selected", 0)],
         question_index=data["question_index"] + 1,
-        temp_selected=set()
+        temp_selected=0
     )
+    if data.get("exam"):
+        changes["question_deadline"] = time.time() + EXAM_QUESTION_SECONDS
+        arm_timer(state.key.chat_id, state.key.user_id, {**data, **changes})
+    await state.update_data(**changes)
+
+async def confirm_answer(callback: CallbackQuery, state: FSMContext, data: dict, payload: CallbackPayload):
+    await record_answer(state, data)
     await send_question(callback, state)
 
-@dp.callback_query(F.data == "details")
-async def show_details(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
+async def show_details(callback: CallbackQuery, state: FSMContext, data: dict, payload: CallbackPayload):
+    single = data.get("ui") == UI_SINGLE
     wrongs = data.get("wrong_answers", [])
     if not wrongs:
-        await callback.message.answer("✅ Усі відповіді правильні!")
-        return
-
-    for item in wrongs:
-        text = f"❌ *{item['question']}*\n"
-        for idx, (opt_text, _) in enumerate(item["options"]):
-            mark = "☑️" if idx in item["selected"] else "🔘"
-            text += f"{mark} {opt_text}\n"
-        selected_text = [item["options"][i][0] for i in item["selected"]] if item["selected"] else ["—"]
-        correct_text = [item["options"][i][0] for i in item["correct"]]
-        text += f"\n_Твоя відповідь:_ {', '.join(selected_text)}"
-        text += f"\n_Правильна відповідь:_ {', '.join(correct_text)}"
-        await callback.message.answer(text, parse_mode="Markdown")
-
-@dp.callback_query(F.data == "restart")
-async def restart_quiz(callback: CallbackQuery, state: FSMContext):
+        if single:
+            await callback.answer("✅ Усі відповіді правильні!", show_alert=True)
+        else:
+            await callback.message.answer("✅ Усі відповіді правильні!")
+        return
+
+    questions = session_questions(data, quiz_tenant(state, data))
+    if not single:
+        for item in wrongs:
+            text = render.details(questions[item["index"]], item["selected"])
+            await callback.message.answer(text, parse_mode="Markdown")
+        return
+
+    # Одна помилка на сторінку, гортання редагує те саме повідомлення
+    page = min(payload.arg, len(wrongs) - 1)
+    item = wrongs[page]
+    text = f"📋 Помилка {page + 1} з {len(wrongs)}\n\n" + render.details(questions[item["index"]], item["selected"])
+    await callback.message.edit_text(
+        text, reply_markup=details_keyboard(data["nonce"], page, len(wrongs)), parse_mode="Markdown"
+    )
+
+def details_keyboard(nonce, page, pages):
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=pack(Action.DETAILS, nonce=nonce, arg=page - 1)))
+    if page + 1 < pages:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=pack(Action.DETAILS, nonce=nonce, arg=page + 1)))
+    rows = [nav] if nav else []
+    rows.append([InlineKeyboardButton(text="📊 До результату", callback_data=pack(Action.RESULT, nonce=nonce))])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+async def show_result(callback: CallbackQuery, state: FSMContext, data: dict, payload: CallbackPayload):
+    if not data.get("result_text"):
+        await callback.answer("⚠️ Ця кнопка більше не діє.")
+        return
+    await callback.message.edit_text(data["result_text"], reply_markup=result_keyboard(data["nonce"]), parse_mode="Markdown")
+
+async def restart_quiz(callback: CallbackQuery, state: FSMContext, data: dict, payload: CallbackPayload):
+    tenant = quiz_tenant(state, data)
+    if data.get("ui") == UI_SINGLE and data.get("category") in tenant.sections:
+        # Той самий розділ заново, в тому ж повідомленні
+        await begin_quiz(state, tenant, callback.from_user, data["category"])
+        await state.update_data(message_id=callback.message.message_id)
+        await send_question(callback, state)
+        return
     await state.clear()
-    await callback.message.answer("Вибери розділ для тесту:", reply_markup=main_keyboard())
+    await callback.message.answer("Вибери розділ для тесту:", reply_markup=main_keyboard(tenant))
+
+CALLBACK_ROUTES = {
+    Action.TOGGLE: toggle_option,
+    Action.CONFIRM: confirm_answer,
+    Action.DETAILS: show_details,
+    Action.RESTART: restart_quiz,
+    Action.RESULT: show_result,
+}
+
+# Дії, прив'язані до конкретного питання: кнопка застаріла, якщо питання вже інше
+QUESTION_ACTIONS = {Action.TOGGLE, Action.CONFIRM}
+
+async def check_practice_answer(callback: CallbackQuery, payload: CallbackPayload):
+    verdict = practice.check(payload.qid, payload.arg)
+    await callback.answer(verdict or "⚠️ Це питання більше не доступне.", show_alert=True)
+
+def group_options(quiz: GroupQuiz):
+    options = list(enumerate(quiz.question.button_labels))
+    random.Random(quiz.seed + quiz.index).shuffle(options)
+    return options
+
+def group_text(quiz: GroupQuiz, reveal: bool = False):
+    question = quiz.question
+    lines = [f"👥 {quiz.category} · питання {quiz.index + 1} з {len(quiz.questions)}", "", question.text, ""]
+    for i, label in group_options(quiz):
+        mark = ("✅" if question.correct_mask >> i & 1 else "▫️") if reveal else "▫️"
+        lines.append(f"{mark} {label} — {quiz.counts[i]}")
+    lines.append("")
+    lines.append(f"🙋 Відповіли: {len(quiz.votes)}")
+    return "\n".join(lines)
+
+def group_keyboard(quiz: GroupQuiz):
+    buttons = [
+        [InlineKeyboardButton(text=label, callback_data=pack(Action.GROUP_VOTE, quiz.index, quiz.nonce, i))]
+        for i, label in group_options(quiz)
+    ]
+    buttons.append([
+        InlineKeyboardButton(text="⏭ Далі", callback_data=pack(Action.GROUP_NEXT, quiz.index, quiz.nonce)),
+        InlineKeyboardButton(text="🏁 Завершити", callback_data=pack(Action.GROUP_STOP, quiz.index, quiz.nonce)),
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def refresh_group_quiz(quiz: GroupQuiz):
+    try:
+        await bot.edit_message_text(
+            group_text(quiz), chat_id=quiz.chat_id, message_id=quiz.message_id, reply_markup=group_keyboard(quiz)
+        )
+    except TelegramBadRequest as e:
+        # Голоси скасували одне одного — текст не змінився
+        if "not modified" not in e.message:
+            raise
+
+group_quizzes = GroupQuizzes(refresh_group_quiz, float(os.getenv("GROUP_REFRESH_SECONDS", 3)))
+
+def current_group_quiz(callback: CallbackQuery, payload: CallbackPayload):
+    quiz = group_quizzes.get(callback.message.chat.id, payload.nonce)
+    return quiz if quiz is not None and quiz.index == payload.qid and not quiz.finished else None
+
+async def group_vote(callback: CallbackQuery, payload: CallbackPayload):
+    quiz = current_group_quiz(callback, payload)
+    if quiz is None:
+        await callback.answer("⚠️ Це питання вже закрите.")
+        return
+    mask = quiz.vote(callback.from_user.id, callback.from_user.full_name, payload.arg)
+    group_quizzes.touch(quiz)
+    chosen = quiz.question.labels_for(mask)
+    # Особистий вибір показуємо у відповіді на натискання — це не коштує окремого виклику API
+    await callback.answer(truncate("Твій вибір: " + "; ".join(chosen), 200) if chosen else "Вибір скасовано")
+
+async def group_advance(callback: CallbackQuery, payload: CallbackPayload):
+    quiz = current_group_quiz(callback, payload)
+    if quiz is None:
+        await callback.answer("⚠️ Це питання вже закрите.")
+        return
+    if callback.from_user.id != quiz.trainer_id:
+        await callback.answer("⛔️ Питання перемикає тренер.")
+        return
+    await callback.answer()
+
+    group_quizzes.cancel(quiz)
+    async with quiz.edit_lock:
+        if quiz.index != payload.qid or quiz.finished:
+            return
+        text = group_text(quiz, reveal=True)
+        message_id = quiz.message_id
+        quiz.close_question()
+        if payload.action == Action.GROUP_STOP:
+            quiz.finished = True
+        try:
+            await bot.edit_message_text(text, chat_id=quiz.chat_id, message_id=message_id)
+        except TelegramAPIError:
+            # Розкриття відповіді — лише оформлення: старі кнопки вже відповідають «питання закрите»
+            logging.exception("Failed to reveal group question in chat %s", quiz.chat_id)
+        if not quiz.finished:
+            try:
+                sent = await bot.send_message(quiz.chat_id, group_text(quiz), reply_markup=group_keyboard(quiz))
+            except TelegramAPIError:
+                # Без повідомлення з кнопками тест не продовжити — підбиваємо підсумок за закритими питаннями
+                logging.exception("Failed to send next group question in chat %s", quiz.chat_id)
+                quiz.finished = True
+            else:
+                quiz.message_id = sent.message_id
+                return
+    group_quizzes.remove(quiz)
+    await finish_group_quiz(quiz)
+
+async def finish_group_quiz(quiz: GroupQuiz):
+    tenant = tenants.for_chat(quiz.chat_id)
+    asked = quiz.closed
+    data = {"category": quiz.category, "question_ids": [q.sid for q in quiz.questions[:asked]], "username": ""}
+    percents = []
+    for user_id in quiz.answers:
+        correct = quiz.score(user_id)
+        percent = round(correct / asked * 100)
+        percents.append(percent)
+        wrongs = [
+            {"index": i, "selected": mask}
+            for i, (question, mask) in enumerate(zip(quiz.questions, quiz.answers[user_id]))
+            if question.correct_mask != mask
+        ]
+        record_attempt(tenant, user_id, {**data, "full_name": quiz.names[user_id]}, correct, percent, wrongs, quiz.answers[user_id], "group")
+
+    lines = [f"🏁 Груповий тест завершено · {quiz.category}", f"Учасників: {len(percents)} · Питань: {asked}"]
+    if percents:
+        lines.append(f"Середній результат: {round(sum(percents) / len(percents))}%")
+        lines.append("")
+        lines.append("🏆 Найкращі:")
+        for place, (name, score) in enumerate(quiz.leaderboard()[:10], 1):
+            lines.append(f"{place}. {name} — {score}/{asked}")
+    await bot.send_message(quiz.chat_id, "\n".join(lines))
+
+# Дії без FSM-сесії: обробляються до читання сховища
+STATELESS_ROUTES = {
+    Action.PRACTICE: check_practice_answer,
+    Action.GROUP_VOTE: group_vote,
+    Action.GROUP_NEXT: group_advance,
+    Action.GROUP_STOP: group_advance,
+}
+
+@dp.callback_query()
+async def route_callback(callback: CallbackQuery, state: FSMContext):
+    payload = unpack(callback.data)
+    if payload and payload.action in STATELESS_ROUTES:
+        await STATELESS_ROUTES[payload.action](callback, payload)
+        return
+
+    handler = CALLBACK_ROUTES.get(payload.action) if payload else None
+    if handler is None:
+        await callback.answer("⚠️ Ця кнопка більше не діє.")
+        return
+
+    data = await state.get_data()
+    if payload.action != Action.RESTART:
+        stale = data.get("nonce") != payload.nonce
+        if payload.action in QUESTION_ACTIONS:
+            stale = stale or data.get("question_index") != payload.qid
+        if stale:
+            await callback.answer("⚠️ Ця кнопка застаріла. Почни тест заново.")
+            return
+
+    api_calls.track((state.key.chat_id, state.key.user_id))
+    await handler(callback, state, data, payload)
 
 @dp.message(F.text == "/start")
-async def cmd_start(message: types.Message):
-    await message.answer("Вибери розділ для тесту:", reply_markup=main_keyboard())
+async def cmd_start(message: types.Message, tenant: Tenant):
+    await message.answer("Вибери розділ для тесту:", reply_markup=main_keyboard(tenant))
+
+@dp.message(F.text == "/exam")
+async def start_exam(message: types.Message, state: FSMContext, tenant: Tenant):
+    await state.clear()
+    await state.update_data(exam_pending=True)
+    await message.answer(
+        "⏱ *Режим іспиту*\n"
+        f"На кожне питання: {format_seconds(EXAM_QUESTION_SECONDS)}, на весь тест: {format_seconds(EXAM_TOTAL_SECONDS)}.\n"
+        "Коли час вийде, відповідь буде зарахована автоматично.\n\n"
+        "Вибери розділ для іспиту:",
+        reply_markup=main_keyboard(tenant),
+        parse_mode="Markdown"
+    )
+
+async def on_exam_timeout(key):
+    chat_id, user_id = key
+    api_calls.track(key)
+    state = FSMContext(storage=storage, key=StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=user_id))
+    data = await state.get_data()
+    if not data:
+        # Сесію витіснено або бот перезапускався — піднімаємо її з чекпоінта
+        saved = checkpointer.get(chat_id, user_id)
+        if saved is None:
+            return
+        data = {**saved, "wrong_answers": [], "nonce": random.getrandbits(32)}
+        await state.set_state(QuizState.category)
+        await state.set_data(data)
+
+    question_ids = data.get("question_ids", [])
+    if not data.get("exam") or data.get("question_index", 0) >= len(question_ids):
+        return
+
+    now = time.time()
+    if data.get("deadline") and now >= data["deadline"]:
+        answered = data["selected_options"] + [data.get("temp_selected", 0)]
+        answered += [0] * (len(question_ids) - len(answered))
+        await state.update_data(selected_options=answered, question_index=len(question_ids), temp_selected=0)
+        notice = "⏰ Час іспиту вичерпано — тест завершено автоматично."
+    elif data.get("question_deadline") and now >= data["question_deadline"]:
+        await record_answer(state, data)
+        notice = "⏰ Час на питання вичерпано — відповідь зараховано як є."
+    else:
+        arm_timer(chat_id, user_id, data)
+        return
+
+    if data.get("ui") == UI_SINGLE:
+        await send_question(chat_id, state, notice)
+    else:
+        await bot.send_message(chat_id, notice)
+        await send_question(chat_id, state)
+
+timers = TimerScheduler(on_exam_timeout)
+
+def rearm_exam_timers():
+    for skey, entry in checkpointer.index.items():
+        if entry.get("exam"):
+            chat_id, user_id = map(int, skey.split(":"))
+            arm_timer(chat_id, user_id, entry)
+
+@dp.message(F.text == "/resume")
+async def resume_quiz(message: types.Message, state: FSMContext, tenant: Tenant):
+    saved = checkpointer.get(message.chat.id, message.from_user.id)
+    if saved is not None and saved.get("tenant") in tenants.tenants:
+        tenant = tenants.tenants[saved["tenant"]]
+    if saved is None or saved.get("category") not in tenant.sections:
+        await message.answer("📭 Немає незавершеного тесту.", reply_markup=main_keyboard(tenant))
+        return
+    if not set(saved.get("question_ids", [])) <= questions_by_sid(tenant, saved["category"]).keys():
+        await message.answer("🔄 Питання тесту змінились, почни його заново.", reply_markup=main_keyboard(tenant))
+        return
+
+    await state.set_state(QuizState.category)
+    await state.set_data({**saved, "wrong_answers": [], "nonce": random.getrandbits(32)})
+    arm_timer(message.chat.id, message.from_user.id, saved)
+    api_calls.track((message.chat.id, message.from_user.id))
+    notice = f"▶️ Продовжуємо тест {saved['category']} з питання {saved['question_index'] + 1}."
+    if saved.get("ui") == UI_SINGLE:
+        await send_question(message, state, notice)
+    else:
+        await message.answer(notice)
+        await send_question(message, state)
 
 @dp.message(F.text == "/myid")
 async def get_my_id(message: types.Message):
     await message.answer(f"👤 Твій Telegram ID: `{message.from_user.id}`", parse_mode="Markdown")
 
-@dp.message(F.text == "/users")
-async def list_users(message: types.Message):
-    if message.from_user.id != ADMIN_ID:
+@dp.message(F.text == "/history")
+async def show_history(message: types.Message, tenant: Tenant):
+    user_id = message.from_user.id
+    attempts = history.last(user_id, 10, tenant.tenant_id)
+    if not attempts:
+        await message.answer("📭 Ще немає завершених тестів.")
+        return
+
+    lines = ["📚 *Останні спроби:*"]
+    for attempt in attempts:
+        lines.append(
+            f"{format_date(attempt.ts)} · {render.escape(attempt.category)} · "
+            f"{attempt.correct}/{attempt.total} ({attempt.percent}%)"
+        )
+    lines.append("")
+    lines.append("🏆 *Найкращі результати:*")
+    for category, (correct, total, ts) in history.best(user_id, tenant.tenant_id).items():
+        lines.append(f"{render.escape(category)}: {correct}/{total} ({round(correct / total * 100)}%), {format_date(ts)}")
+    await message.answer("\n".join(lines), parse_mode="Markdown")
+
+# Адмінські команди показують дані користувачів, тож відповідають лише в особистому чаті з ботом
+async def admin_in_private(message: types.Message, tenant: Tenant) -> bool:
+    if not tenant.is_admin(message.from_user.id):
         await message.answer("⛔️ Недостатньо прав.")
+        return False
+    if message.chat.type != "private":
+        await message.answer("🔒 Ця команда працює лише в особистому чаті з ботом.")
+        return False
+    return True
+
+@dp.message(F.text == "/users")
+async def list_users(message: types.Message, tenant: Tenant):
+    if not await admin_in_private(message, tenant):
         return
 
-    if not os.path.exists("logs.txt"):
+    await fileio.flush(tenant.log_path)
+    lines = fileio.read_lines(tenant.log_path)
+    if await anext(lines, None) is None:
         await message.answer("📄 Логів ще немає.")
         return
 
-    with open("logs.txt", "r", encoding="utf-8") as f:
-        lines = f.readlines()[1:]
-
     users = set()
-    for line in lines:
+    async for line in lines:
         parts = line.strip().split(" | ")
         if len(parts) >= 2:
             name = parts[0]
@@ -228,10 +769,496 @@ async def list_users(message: types.Message):
 
     sorted_users = sorted(users)
     text = "👥 *Користувачі, які проходили тести:*\n"
-    text += "\n".join(f"\u2022 {user}" for user in sorted_users)
+    text += "\n".join(f"\u2022 {render.escape(user)}" for user in sorted_users)
+    await message.answer(text, parse_mode="Markdown")
+
+@functools.lru_cache(maxsize=None)
+def report_pool():
+    # Один процес: звіти рідкісні, а головне — не займати цикл подій.
+    # fork, а не spawn: spawn заново імпортував би main.py в дочірньому процесі (бот, банки, орендарі).
+    # Щоб fork не скопіював захоплені блокування чужих потоків, main() створює пул до першого потоку;
+    # з fork процес запускається одразу на першому submit
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(method))
+
+@dp.message(F.text.startswith("/export"))
+async def export_results(message: types.Message, tenant: Tenant):
+    if not await admin_in_private(message, tenant):
+        return
+
+    fmt = message.text.partition(" ")[2].strip().lower() or "csv"
+    if fmt not in ("csv", "xlsx"):
+        await message.answer("📤 Використання: /export [csv|xlsx]")
+        return
+    if fmt == "xlsx" and not reports.xlsx_available():
+        await message.answer("⚠️ Для XLSX потрібен пакет openpyxl, надсилаю CSV.")
+        fmt = "csv"
+
+    await message.answer("⏳ Готую звіт…")
+    question_texts = {category: question_texts_for(tenant, category) for category in tenant.sections}
+    await fileio.flush(tenant.attempts_path)
+    out_dir = await fileio.run(functools.partial(tempfile.mkdtemp, prefix="export_"))
+    try:
+        loop = asyncio.get_running_loop()
+        paths = await loop.run_in_executor(
+            report_pool(), reports.build_report, tenant.attempts_path, out_dir, fmt, question_texts
+        )
+        for path in paths:
+            await message.answer_document(FSInputFile(path))
+    finally:
+        await fileio.run(shutil.rmtree, out_dir, True)
+
+broadcasts = BroadcastEngine(bot)
+certs = CertStore(os.getenv("CERTS_PATH", "certs.jsonl"))
+
+def find_section(tenant: Tenant, name: str):
+    wanted = tokenize(name)
+    for category in tenant.sections:
+        if tokenize(category) == wanted:
+            return category
+    return None
+
+@dp.message(F.text.startswith("/broadcast "))
+async def start_broadcast(message: types.Message, tenant: Tenant):
+    if not await admin_in_private(message, tenant):
+        return
+
+    target, _, text = message.text.partition(" ")[2].strip().partition(" ")
+    text = text.strip()
+    category = None
+    if target.startswith("notpassed:"):
+        category = find_section(tenant, target.partition(":")[2])
+        if category is None:
+            await message.answer("🤷 Такого розділу немає.")
+            return
+    elif target != "all":
+        text = ""
+    if not text:
+        await message.answer(
+            "📣 Використання:\n"
+            "/broadcast all <текст> — усім, хто проходив тести\n"
+            "/broadcast notpassed:<розділ> <текст> — тим, хто ще не здав розділ"
+        )
+        return
+
+    await fileio.flush(tenant.log_path, tenant.attempts_path)
+    users = await fileio.run(collect_users, tenant.log_path, tenant.attempts_path, PASS_PERCENT)
+    targets = [user.user_id for user in users.values() if category is None or category not in user.passed]
+    if not targets:
+        await message.answer("🙃 Немає кому надсилати.")
+        return
+
+    job = await broadcasts.create(text, targets)
+    broadcasts.start(job)
+    await message.answer(f"📣 Розсилка {job.job_id} запущена: {len(targets)} адресатів.")
+
+@dp.message(F.text == "/broadcasts")
+async def broadcast_status(message: types.Message, tenant: Tenant):
+    if not await admin_in_private(message, tenant):
+        return
+
+    if not broadcasts.jobs:
+        await message.answer("📭 Розсилок ще не було.")
+        return
+
+    lines = ["📣 Розсилки:"]
+    for job in sorted(broadcasts.jobs.values(), key=lambda job: job.created)[-10:]:
+        status = "✅" if job.finished else "⏳"
+        failures = ", ".join(f"{reason}: {count}" for reason, count in job.failures.items()) or "—"
+        lines.append(
+            f"{status} {job.job_id}: {job.sent}/{len(job.targets)} надіслано, "
+            f"{job.throughput():.1f} повід./с, помилки: {failures}"
+        )
+    await message.answer("\n".join(lines))
+
+@dp.message(F.text.startswith("/expiring"))
+async def expiring_certs(message: types.Message, tenant: Tenant):
+    if not await admin_in_private(message, tenant):
+        return
+
+    arg = message.text.partition(" ")[2].strip()
+    days = int(arg) if arg.isdigit() else 30
+    now = time.time()
+    expired = certs.expiring_between(0, now, tenant.tenant_id)
+    expiring = certs.expiring_between(now, now + days * DAY, tenant.tenant_id)
+    if not expired and not expiring:
+        await message.answer(f"✅ Ні в кого не спливає термін у найближчі {days} дн.")
+        return
+
+    lines = []
+    if expired:
+        lines.append(f"⛔️ Прострочено ({len(expired)}):")
+        lines += [f"• {c.name} — {c.category}, до {format_date(c.expires_at)}" for c in expired[-50:]]
+    if expiring:
+        lines.append(f"⏳ Спливає за {days} дн. ({len(expiring)}):")
+        lines += [f"• {c.name} — {c.category}, до {format_date(c.expires_at)}" for c in expiring[:50]]
+    await message.answer("\n".join(lines))
+
+async def send_cert_reminders():
+    now = time.time()
+    groups = {}
+    for cert in certs.expiring_between(now - DAY, now + CERT_REMIND_DAYS * DAY):
+        if not cert.reminded:
+            groups.setdefault((cert.category, format_date(cert.expires_at)), []).append(cert)
+    for (category, date), group in groups.items():
+        text = f"⏰ Термін дії твого тесту {category} спливає {date}. Пройди його ще раз, щоб продовжити."
+        broadcasts.start(await broadcasts.create(text, [cert.user_id for cert in group]))
+        for cert in group:
+            certs.mark_reminded(cert)
+
+async def run_cert_reminders(interval: float = 6 * 3600):
+    while True:
+        await send_cert_reminders()
+        await asyncio.sleep(interval)
+
+@functools.lru_cache(maxsize=None)
+def search_index(tenant: Tenant):
+    return SearchIndex.build(tenant.sections)
+
+def describe_hit(hit):
+    return f"{hit.category} №{hit.position + 1}", hit.question.text, ", ".join(hit.question.correct_labels)
+
+async def is_trainer(message: types.Message, tenant: Tenant):
+    if tenant.is_admin(message.from_user.id):
+        return True
+    if message.chat.type == "private":
+        return False
+    member = await bot.get_chat_member(message.chat.id, message.from_user.id)
+    return member.status in ("creator", "administrator")
+
+@dp.message(F.text.regexp(r"^/group(@\w+)?(\s|$)"))
+async def start_group_quiz(message: types.Message, tenant: Tenant):
+    if not await is_trainer(message, tenant):
+        await message.answer("⛔️ Недостатньо прав.")
+        return
+    if message.chat.id in group_quizzes.by_chat:
+        await message.answer("⚠️ У цьому чаті вже йде груповий тест.")
+        return
+
+    name = message.text.partition(" ")[2].strip()
+    category = find_section(tenant, name) if name else None
+    if category is None:
+        await message.answer("👥 Вкажи розділ: /group <розділ>\n\n" + "\n".join(tenant.sections))
+        return
+
+    questions = tenant.sections[category][:QUIZ_SIZE]
+    quiz = GroupQuiz(message.chat.id, message.from_user.id, category, questions,
+                     random.getrandbits(32), random.getrandbits(32))
+    # Реєструємо до відправки, щоб другий /group не пройшов перевірку, поки перший чекає на Telegram;
+    # якщо відправка не вдалась, чат не має залишитись із тестом без повідомлення
+    group_quizzes.add(quiz)
+    try:
+        sent = await message.answer(group_text(quiz), reply_markup=group_keyboard(quiz))
+    except Exception:
+        group_quizzes.remove(quiz)
+        raise
+    quiz.message_id = sent.message_id
+
+@dp.message(F.text.startswith("/find"))
+async def find_question(message: types.Message, tenant: Tenant):
+    # Результати містять правильні відповіді — у групі їх побачили б ті, хто проходить тест
+    if not await admin_in_private(message, tenant):
+        return
+
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await message.answer("🔎 Використання: /find <текст питання або відповіді>")
+        return
+
+    hits = search_index(tenant).search(query)
+    if not hits:
+        await message.answer("🤷 Нічого не знайдено.")
+        return
+
+    blocks = []
+    for hit in hits:
+        where, text, correct = describe_hit(hit)
+        blocks.append(f"{where}\n{text}\n✅ {correct}")
+    await message.answer("\n\n".join(blocks))
+
+# Інлайн-запити не мають чату, тож працюють з банками орендаря за замовчуванням
+practice = InlinePractice(
+    sections, {category: bank_names[id(questions)] for category, questions in sections.items()},
+    lambda: search_index(tenants.default),
+)
+
+# Офлайн-пакети: адреса, за якою HTTP-сервер бота доступний ззовні (Web App вимагає HTTPS).
+# Без неї пакет надсилається HTML-файлом, який працює без мережі, але результат не повертає.
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")
+
+packs = PracticePacks(lambda: (
+    (tenant.tenant_id, category, questions)
+    for tenant in tenants.tenants.values()
+    for category, questions in tenant.sections.items()
+))
+
+@dp.message(F.text.startswith("/offline"))
+async def offline_pack(message: types.Message, tenant: Tenant):
+    category = find_section(tenant, message.text.partition(" ")[2])
+    if category is None:
+        await message.answer("📦 Використання: /offline <розділ>\nРозділи: " + ", ".join(tenant.sections))
+        return
+    pack = packs.for_section(tenant.tenant_id, category, tenant.sections[category])
+    if not pack.questions:
+        await message.answer("⚠️ У цьому розділі немає питань без картинок.")
+        return
+
+    # sendData працює лише з Web App, відкритого кнопкою звичайної клавіатури, а такі кнопки Telegram
+    # приймає тільки в особистих чатах; у групі надсилаємо файл
+    if PUBLIC_URL and message.chat.type == "private":
+        keyboard = types.ReplyKeyboardMarkup(keyboard=[[types.KeyboardButton(
+            text=f"📦 {category}", web_app=WebAppInfo(url=f"{PUBLIC_URL}/pack/{pack.pack_id}.html")
+        )]], resize_keyboard=True)
+        await message.answer(
+            f"📦 Практика {category}: {len(pack.questions)} питань перевіряються прямо на телефоні. "
+            "Після завантаження мережа не потрібна, боту надсилається лише результат.",
+            reply_markup=keyboard
+        )
+    else:
+        await message.answer_document(
+            BufferedInputFile(pack.body, filename=f"practice-{pack.pack_id}.html"),
+            caption=f"📦 Практика {category}: відкрий файл у браузері, мережа не потрібна."
+        )
+
+@dp.message(F.web_app_data)
+async def offline_result(message: types.Message, tenant: Tenant):
+    try:
+        payload = json.loads(message.web_app_data.data)
+        pack = packs.get(payload["p"])
+        masks = [int(mask) for mask in payload["a"]]
+    except (ValueError, KeyError, TypeError):
+        pack = None
+    if pack is None or pack.tenant_id != tenant.tenant_id or len(masks) != len(pack.questions):
+        await message.answer("⚠️ Не вдалося прийняти результат: пакет застарів.", reply_markup=main_keyboard(tenant))
+        return
+    if any(not 0 <= mask < 1 << len(q.labels) for q, mask in zip(pack.questions, masks)):
+        await message.answer("⚠️ Не вдалося прийняти результат: некоректні відповіді.", reply_markup=main_keyboard(tenant))
+        return
+
+    # Маски перевіряємо самі — захешовані відповіді в сторінці підбираються перебором
+    correct, wrongs = check_answers(pack.questions, masks)
+    percent = round(correct / len(pack.questions) * 100)
+    data = {
+        "category": pack.category,
+        "question_ids": [q.sid for q in pack.questions],
+        "full_name": message.from_user.full_name,
+        "username": message.from_user.username or "немає",
+    }
+    record_attempt(tenant, message.from_user.id, data, correct, percent, wrongs, masks, reports.MODE_PRACTICE)
+    # Сертифікат не видаємо: відповіді можна перевірити заздалегідь, тож це лише практика
+    await message.answer(
+        "📦 Офлайн-практика\n\n" + render.result(correct, len(pack.questions), percent),
+        reply_markup=main_keyboard(tenant),
+        parse_mode="Markdown"
+    )
+
+async def web_quiz_result(submission: WebSubmission):
+    tenant, user, questions = submission.tenant, submission.user, submission.questions
+    correct, wrongs = check_answers(questions, submission.masks)
+    percent = round(correct / len(questions) * 100)
+    full_name = " ".join(filter(None, (user.first_name, user.last_name)))
+    username = user.username or "немає"
+    data = {"category": submission.category, "question_ids": [q.sid for q in questions], "full_name": full_name, "username": username}
+    record_attempt(tenant, user.id, data, correct, percent, wrongs, submission.masks, "web")
+    cert = None
+    if percent >= PASS_PERCENT:
+        cert = certs.record_pass(tenant.tenant_id, user.id, submission.category, f"{full_name} @{username}", percent, CERT_VALID_DAYS)
+    valid_until = format_date(cert.expires_at) if cert is not None else None
+    try:
+        await bot.send_message(user.id, "🌐 " + render.result(correct, len(questions), percent, valid_until), parse_mode="Markdown")
+    except TelegramAPIError:
+        # Результат уже зараховано і показано на сторінці — повідомлення в чаті лише копія
+        pass
+    return {
+        "correct": correct,
+        "total": len(questions),
+        "percent": percent,
+        "valid_until": valid_until,
+        "mistakes": [(item["index"], questions[item["index"]].correct_mask) for item in wrongs],
+    }
+
+web_quiz = WebQuiz(TOKEN, tenants, QUIZ_SIZE, web_quiz_result)
+
+@dp.message(F.text == "/app")
+async def open_web_quiz(message: types.Message, tenant: Tenant):
+    if not PUBLIC_URL:
+        await message.answer("⚠️ Web App не налаштовано: потрібна адреса PUBLIC_URL.")
+        return
+    if message.chat.type != "private":
+        # web_app-кнопки Telegram приймає лише в особистих чатах; орендар групи підхопиться там за учасником
+        me = await bot.me()
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="💬 Написати боту", url=f"https://t.me/{me.username}")]])
+        await message.answer("🌐 Web App відкривається лише в особистому чаті: напиши мені /app там.", reply_markup=keyboard)
+        return
+    # initData з підписом Telegram є лише у Web App, відкритого інлайн-кнопкою
+    url = f"{PUBLIC_URL}/app.html?" + urlencode({
+        "t": tenant.tenant_id, "k": web_quiz.link_token(tenant.tenant_id), "v": web_quiz.bank(tenant.tenant_id).etag,
+    })
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🌐 Почати тест", web_app=WebAppInfo(url=url))]])
+    await message.answer("🌐 Тест у Web App: питання вантажаться один раз, відповіді надсилаються разом наприкінці.", reply_markup=keyboard)
+
+@dp.inline_query()
+async def inline_query(query: InlineQuery, tenant: Tenant):
+    # "!запит" від адміна — пошук з відповідями, все інше — практика для всіх
+    if tenant.is_admin(query.from_user.id) and query.query.startswith("!"):
+        await inline_search(query, tenant, query.query[1:])
+        return
+
+    results, next_offset = practice.results(query.query, query.offset)
+    await query.answer(results, cache_time=CACHE_TIME, next_offset=next_offset)
+
+async def inline_search(query: InlineQuery, tenant: Tenant, text: str):
+    results = []
+    for hit in search_index(tenant).search(text, limit=20):
+        where, text, correct = describe_hit(hit)
+        results.append(InlineQueryResultArticle(
+            id=f"{hit.category}:{hit.position}"[:64],
+            title=text[:100],
+            description=f"{where} · ✅ {correct}"[:200],
+            input_message_content=InputTextMessageContent(message_text=f"{where}\n{text}\n\n✅ {correct}"),
+        ))
+    await query.answer(results, cache_time=5, is_personal=True)
+
+@dp.message(F.text == "/sessions")
+async def session_stats(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("⛔️ Недостатньо прав.")
+        return
+
+    stats = storage.stats
+    text = (
+        "🧠 *Сесії:*\n"
+        f"Активних: {len(storage.sessions)} з {storage.max_sessions}\n"
+        f"Пам'ять: {storage.memory_used // 1024} KB з {storage.memory_budget // 1024} KB\n"
+        f"Прострочено (TTL): {stats['expired']}\n"
+        f"Витіснено (LRU): {stats['evicted_lru']}\n"
+        f"Витіснено (пам'ять): {stats['evicted_memory']}\n\n"
+        "👥 *Групові тести:*\n"
+        f"Активних: {len(group_quizzes.by_chat)}, редагувань табло: {group_quizzes.edits}\n\n"
+        "📚 *Історія спроб:*\n"
+        f"Спроб: {history.attempts}, користувачів: {len(history.users)}, {history.size() // 1024} KB\n\n"
+        "🖼 *Картинки:*\n"
+        f"У кеші file\\_id: {len(media.file_ids)}\n"
+        f"Завантажено: {media.stats['uploads']}, з кешу: {media.stats['hits']}\n\n"
+        "📡 *Виклики API на завершений тест:*\n"
+    )
+    for mode, label in ((UI_CLASSIC, "Класичний"), (UI_SINGLE, "Одне повідомлення")):
+        summary = api_calls.summary(mode)
+        if summary is not None:
+            count, mean, p95 = summary
+            text += f"{label}: {mean:.1f} в середньому, p95 {p95} ({count} тестів)\n"
+    text += f"Усього викликів: {api_calls.total}"
     await message.answer(text, parse_mode="Markdown")
 
+def profiled_handlers():
+    handlers = {}
+    for observer in (dp.message, dp.callback_query, dp.inline_query):
+        for handler in observer.handlers:
+            handlers[handler.callback.__code__] = handler.callback.__name__
+    # route_callback лише диспетчеризує — час рахуємо конкретним діям
+    for routes in (CALLBACK_ROUTES, STATELESS_ROUTES):
+        for handler in routes.values():
+            handlers[handler.__code__] = handler.__name__
+    return handlers
+
+profile_session = None
+# Посилання на задачу тримаємо самі: цикл подій зберігає лише слабкі
+profile_tasks = set()
+
+@dp.message(F.text.startswith("/profile"))
+async def start_profile(message: types.Message):
+    global profile_session
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("⛔️ Недостатньо прав.")
+        return
+    if profile_session is not None:
+        await message.answer("⏳ Профілювання вже триває.")
+        return
+
+    arg = message.text.partition(" ")[2].strip()
+    seconds = min(max(int(arg), 1), 600) if arg.isdigit() else 30
+    profile_session = ProfileSession(profiled_handlers(), float(os.getenv("PROFILE_INTERVAL", 0.005)))
+    profile_session.start((dp.message, dp.callback_query, dp.inline_query))
+    await message.answer(f"🔬 Профілюю {seconds} с…")
+    task = asyncio.create_task(finish_profile(message.chat.id, seconds))
+    profile_tasks.add(task)
+    task.add_done_callback(profile_tasks.discard)
+
+async def finish_profile(chat_id: int, seconds: int):
+    global profile_session
+    await asyncio.sleep(seconds)
+    profile_session.stop()
+    try:
+        report = await asyncio.to_thread(profile_session.report)
+        folded, summary = await asyncio.to_thread(lambda: (report.folded(), report.summary()))
+    finally:
+        # Нова сесія не стартує, поки ця не відпустила tracemalloc
+        profile_session = None
+
+    out_dir = await fileio.run(functools.partial(tempfile.mkdtemp, prefix="profile_"))
+    try:
+        path = os.path.join(out_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        await fileio.write_atomic(path, folded)
+        await bot.send_message(chat_id, truncate(summary, MESSAGE_LIMIT))
+        await bot.send_document(chat_id, FSInputFile(path), caption="🔥 Стеки для flamegraph.pl / speedscope")
+    finally:
+        await fileio.run(shutil.rmtree, out_dir, True)
+
+@dp.startup()
+async def on_startup():
+    profiler.finish()
+
+background_tasks = []
+web_server = None
+
+@dp.shutdown()
+async def on_shutdown():
+    # Сюди aiogram приходить після SIGTERM, коли нові апдейти вже не беруться, а сесія бота ще відкрита
+    if not await lifecycle.drain():
+        logging.warning("%d handlers still running after %ss, shutting down anyway", lifecycle.in_flight, lifecycle.drain_timeout)
+    for task in background_tasks:
+        task.cancel()
+    await broadcasts.stop(timeout=5)
+    await checkpointer.flush()
+    await fileio.close_all()
+    if report_pool.cache_info().currsize:
+        await asyncio.to_thread(report_pool().shutdown, cancel_futures=True)
+    if web_server is not None:
+        await asyncio.to_thread(web_server.stop)
+    await lifecycle.release(bot)
+
 async def main():
+    global web_server
+    web_quiz.loop = asyncio.get_running_loop()
+    # Першим, поки в процесі ще немає потоків файлового I/O і HTTP-сервера
+    with profiler.phase("report worker"):
+        report_pool().submit(int)
+    # Стан вантажимо лише після того, як попередній інстанс дописав свої чекпоінти й відпустив lock
+    with profiler.phase("instance handover"):
+        await lifecycle.acquire(bot)
+    with profiler.phase("http server thread"):
+        web_server = web.start_server(
+            port=int(os.getenv("PORT", 8080)), healthy=lambda: not lifecycle.draining,
+            packs=packs, quiz=web_quiz, media_dir=MEDIA_DIR,
+        )
+    # Незалежна дискова ініціалізація йде паралельно в пулі файлового I/O
+    with profiler.phase("checkpoints + log files"):
+        await asyncio.gather(
+            fileio.run(checkpointer.load),
+            fileio.run(ensure_log_files),
+            fileio.run(certs.load),
+            fileio.run(media.load),
+            fileio.run(history.load),
+            fileio.run(sync_question_ids),
+            fileio.run(tenants.load_members, os.getenv("TENANT_MEMBERS_PATH", "tenant_members.jsonl")),
+        )
+    background_tasks.append(asyncio.create_task(storage.run_sweeper()))
+    # Цикл чекпоінтів не скасовуємо: скасування посеред запису відпустило б блокування раніше, ніж потік допише файл
+    asyncio.create_task(checkpointer.run())
+    rearm_exam_timers()
+    await broadcasts.resume()
+    background_tasks.append(asyncio.create_task(run_cert_reminders()))
+    background_tasks.append(asyncio.create_task(timers.run()))
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
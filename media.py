@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Tuple, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+import fileio
+
+logger = logging.getLogger(__name__)
+
+PhotoSender = Callable[[Union[str, FSInputFile]], Awaitable[Union[Message, bool]]]
+
+
+# Кеш file_id завантажених картинок. Ключ — sha256 вмісту, тож перейменування файлу
+# не змушує вантажити його знову, а заміна картинки — змушує. Кожен файл вантажиться
+# в Telegram один раз, далі всі відправки йдуть за file_id без трафіку.
+# На диску — журнал рядків {"sha256": ..., "file_id": ...}, пізніший рядок перемагає.
+class MediaCache:
+    def __init__(self, path: str):
+        self.path = path
+        self.file_ids: Dict[str, str] = {}
+        self.stats: Counter = Counter()
+        self._digests: Dict[str, Tuple[float, int, str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.file_ids[entry["sha256"]] = entry["file_id"]
+
+    def digest(self, path: str) -> str:
+        # Хешуємо файл лише коли він змінився на диску
+        stat = os.stat(path)
+        cached = self._digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                sha.update(chunk)
+        self._digests[path] = (stat.st_mtime, stat.st_size, sha.hexdigest())
+        return sha.hexdigest()
+
+    def remember(self, digest: str, file_id: str) -> None:
+        self.file_ids[digest] = file_id
+        fileio.appender(self.path).write(json.dumps({"sha256": digest, "file_id": file_id}) + "\n")
+
+    async def send(self, path: str, send: PhotoSender) -> Union[Message, bool]:
+        digest = await fileio.run(self.digest, path)
+        file_id = self.file_ids.get(digest)
+        if file_id is not None:
+            try:
+                result = await send(file_id)
+                self.stats["hits"] += 1
+                return result
+            except TelegramBadRequest as e:
+                if "file" not in e.message.lower():
+                    raise
+                # file_id від іншого токена або видалений на боці Telegram — вантажимо заново
+                logger.warning("Cached file_id for %s rejected: %s", path, e.message)
+                if self.file_ids.get(digest) == file_id:
+                    del self.file_ids[digest]
+        # Поки файл вантажиться, паралельні відправки тієї ж картинки чекають на його file_id
+        async with self._locks.setdefault(digest, asyncio.Lock()):
+            file_id = self.file_ids.get(digest)
+            if file_id is not None:
+                self.stats["hits"] += 1
+                return await send(file_id)
+            result = await send(FSInputFile(path))
+            self.stats["uploads"] += 1
+            if isinstance(result, Message) and result.photo:
+                self.remember(digest, result.photo[-1].file_id)
+            return result
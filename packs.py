@@ -0,0 +1,165 @@
+import hashlib
+import json
+import random
+import threading
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from bank import Question
+
+# Офлайн-практика: розділ пакується в одну самодостатню HTML-сторінку, яка перевіряє відповіді
+# сама — бот не отримує жодного натискання, лише фінальну відповідь через WebApp.sendData.
+# Правильні маски в сторінці лише захешовані (sha256 від id пакета, номера й маски): це ховає
+# відповіді від погляду в код, але не від перебору, тож сервер перевіряє надіслані маски сам.
+# id пакета — хеш вмісту, тож URL незмінний, поки не зміниться банк, і сторінку можна кешувати назавжди.
+
+HASH_CHARS = 16
+
+PackSource = Callable[[], Iterable[Tuple[str, str, Sequence[Question]]]]
+
+
+def answer_hash(pack_id: str, index: int, mask: int) -> str:
+    return hashlib.sha256(f"{pack_id}:{index}:{mask}".encode()).hexdigest()[:HASH_CHARS]
+
+
+class PracticePack:
+    __slots__ = ("pack_id", "tenant_id", "category", "questions", "body", "etag")
+
+    def __init__(self, tenant_id: str, category: str, questions: Sequence[Question]):
+        self.tenant_id = tenant_id
+        self.category = category
+        # Картинок в офлайн-сторінці немає, а без них такі питання не мають сенсу
+        self.questions = tuple(q for q in questions if q.image is None)
+        content = json.dumps([tenant_id, category, [(q.text, q.labels, q.correct_mask) for q in self.questions]])
+        self.pack_id = hashlib.sha256(content.encode()).hexdigest()[:HASH_CHARS]
+        self.body = render_page(self).encode()
+        self.etag = hashlib.sha256(self.body).hexdigest()[:HASH_CHARS]
+
+
+def render_page(pack: PracticePack) -> str:
+    questions = []
+    for i, question in enumerate(pack.questions):
+        options = list(enumerate(question.labels))
+        # Порядок залежить лише від вмісту пакета, тож сторінка за тим самим URL не змінюється між запусками
+        random.Random(f"{pack.pack_id}:{i}").shuffle(options)
+        questions.append({"t": question.text, "o": options, "h": answer_hash(pack.pack_id, i, question.correct_mask)})
+    data = json.dumps({"id": pack.pack_id, "title": pack.category, "q": questions}, ensure_ascii=False)
+    # "</" всередині JSON закрив би тег script
+    return PAGE.replace("__TITLE__", _html(pack.category)).replace("__DATA__", data.replace("</", "<\\/"))
+
+
+def _html(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class PracticePacks:
+    def __init__(self, source: PackSource):
+        self.source = source
+        self.by_key: Dict[Tuple[str, str], PracticePack] = {}
+        self.by_id: Dict[str, PracticePack] = {}
+        # Сторінки віддає потік HTTP-сервера, а будує і цикл подій — збираємо під блокуванням
+        self._lock = threading.Lock()
+
+    def for_section(self, tenant_id: str, category: str, questions: Sequence[Question]) -> PracticePack:
+        with self._lock:
+            pack = self.by_key.get((tenant_id, category))
+            if pack is None:
+                pack = self._add(PracticePack(tenant_id, category, questions))
+            return pack
+
+    def get(self, pack_id: str) -> Optional[PracticePack]:
+        pack = self.by_id.get(pack_id)
+        if pack is None:
+            # Кнопка з минулого запуску: пакети ще не зібрані, збираємо всі одразу
+            with self._lock:
+                for tenant_id, category, questions in self.source():
+                    if (tenant_id, category) not in self.by_key:
+                        self._add(PracticePack(tenant_id, category, questions))
+            pack = self.by_id.get(pack_id)
+        return pack
+
+    def _add(self, pack: PracticePack) -> PracticePack:
+        self.by_key[pack.tenant_id, pack.category] = pack
+        self.by_id[pack.pack_id] = pack
+        return pack
+
+
+PAGE = """<!DOCTYPE html>
+<html lang="uk">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>__TITLE__</title>
+<script src="https://telegram.org/js/telegram-web-app.js" async></script>
+<style>
+body{font-family:system-ui,sans-serif;margin:0;padding:16px;background:var(--tg-theme-bg-color,#fff);color:var(--tg-theme-text-color,#222)}
+h1{font-size:18px;margin:0 0 8px}#p{opacity:.6;font-size:14px}#q{font-size:17px;margin:16px 0;white-space:pre-wrap}
+button{display:block;width:100%;margin:6px 0;padding:12px;font-size:15px;text-align:left;border:1px solid #8884;border-radius:8px;background:none;color:inherit}
+button.on{background:#8883}button.go{text-align:center;background:var(--tg-theme-button-color,#2a7ae2);color:var(--tg-theme-button-text-color,#fff);border:0}
+#v{font-size:17px;margin:12px 0}
+</style>
+</head>
+<body>
+<h1>__TITLE__</h1>
+<div id="p"></div><div id="q"></div><div id="o"></div><div id="v"></div><div id="a"></div>
+<script>
+const PACK = __DATA__;
+const $ = id => document.getElementById(id);
+let i = 0, mask = 0, correct = 0;
+const masks = [];
+
+async function digest(text) {
+  const buf = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(buf), b => b.toString(16).padStart(2, "0")).join("").slice(0, __HASH_CHARS__);
+}
+
+function button(text, cls, onclick) {
+  const b = document.createElement("button");
+  b.textContent = text;
+  b.className = cls;
+  b.onclick = onclick;
+  return b;
+}
+
+function show() {
+  const q = PACK.q[i];
+  mask = 0;
+  $("p").textContent = `Питання ${i + 1} з ${PACK.q.length}`;
+  $("q").textContent = q.t;
+  $("v").textContent = "";
+  $("o").replaceChildren(...q.o.map(([bit, label]) => button("◻️ " + label, "", e => {
+    mask ^= 1 << bit;
+    e.target.className = mask >> bit & 1 ? "on" : "";
+    e.target.textContent = (mask >> bit & 1 ? "✅ " : "◻️ ") + label;
+  })));
+  $("a").replaceChildren(button("✅ Підтвердити", "go", check));
+}
+
+async function check() {
+  $("a").replaceChildren();
+  const ok = await digest(`${PACK.id}:${i}:${mask}`) === PACK.q[i].h;
+  masks.push(mask);
+  if (ok) correct++;
+  $("o").querySelectorAll("button").forEach(b => b.disabled = true);
+  $("v").textContent = ok ? "✅ Правильно!" : "❌ Неправильно.";
+  $("a").replaceChildren(button(i + 1 < PACK.q.length ? "Далі ➡️" : "🏁 Результат", "go", next));
+}
+
+function next() {
+  if (++i < PACK.q.length) return show();
+  // Web App з кнопки клавіатури не отримує initData, тож Telegram впізнаємо за платформою
+  const app = window.Telegram && Telegram.WebApp.platform !== "unknown" ? Telegram.WebApp : null;
+  $("p").textContent = "";
+  $("o").replaceChildren();
+  $("q").textContent = `📊 Правильних відповідей: ${correct} з ${PACK.q.length} (${Math.round(correct / PACK.q.length * 100)}%)`;
+  $("v").textContent = app ? "" : "Результат лишається на цьому пристрої.";
+  $("a").replaceChildren(
+    ...(app ? [button("📨 Надіслати результат", "go", () => app.sendData(JSON.stringify({p: PACK.id, a: masks})))] : []),
+    button("🔁 Пройти ще раз", "", () => { i = 0; correct = 0; masks.length = 0; show(); })
+  );
+}
+
+show();
+</script>
+</body>
+</html>
+""".replace("__HASH_CHARS__", str(HASH_CHARS))
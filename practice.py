@@ -0,0 +1,91 @@
+import functools
+import random
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram.types import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
+
+from bank import Question
+from callbacks import Action, pack
+from search import SearchIndex, normalize, tokenize
+
+PAGE_SIZE = 20
+CACHE_TIME = 300
+
+
+# ID питання в кнопках практики: 16 біт від назви банку і стабільний ID питання в ньому (bankdiff.py).
+# Кнопки живуть у чатах безстроково, тож після правки банку вони мають вказувати на те саме питання.
+def practice_id(bank: str, sid: int) -> int:
+    return (zlib.crc32(bank.encode()) & 0xFFFF) << 16 | sid & 0xFFFF
+
+
+# Інлайн-практика: окремі питання з банку без FSM-сесії.
+# Статті рендеряться один раз на питання, списки ID — один раз на запит,
+# а сторінки просто ріжуть готовий список; перевірка відповіді не читає сховище.
+class InlinePractice:
+    def __init__(self, sections: Dict[str, Sequence[Question]], banks: Dict[str, str],
+                 search_index: Callable[[], SearchIndex]):
+        self.sections = sections
+        # Розділ -> назва банку в questions.py
+        self.banks = banks
+        self.search_index = search_index
+        self.aliases = {term: category for category in sections for term in tokenize(category)}
+
+    # Стабільні ID призначаються під час старту, тож індекс будуємо при першому запиті
+    @functools.cached_property
+    def questions(self) -> Dict[int, Question]:
+        return {self.key(q): q for questions in self.sections.values() for q in questions}
+
+    def key(self, question: Question) -> int:
+        return practice_id(self.banks[question.category], question.sid)
+
+    @functools.lru_cache(maxsize=None)
+    def article(self, qid: int) -> InlineQueryResultArticle:
+        question = self.questions[qid]
+        options = list(enumerate(question.button_labels))
+        random.Random(qid).shuffle(options)
+        buttons = [
+            [InlineKeyboardButton(text=label, callback_data=pack(Action.PRACTICE, qid, arg=i))]
+            for i, label in options
+        ]
+        return InlineQueryResultArticle(
+            id=str(qid),
+            title=question.text[:100],
+            description=question.category,
+            input_message_content=InputTextMessageContent(message_text=f"🧩 {question.text}"),
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
+        )
+
+    @functools.lru_cache(maxsize=1024)
+    def _matches(self, query: str) -> Tuple[int, ...]:
+        if not query:
+            return tuple(self.questions)
+        category = self.aliases.get(query)
+        if category is not None:
+            return tuple(self.key(q) for q in self.sections[category])
+        hits = self.search_index().search(query, limit=200)
+        return tuple(self.key(hit.question) for hit in hits)
+
+    def results(self, query: str, offset: str = "") -> Tuple[List[InlineQueryResultArticle], str]:
+        qids = self._matches(" ".join(normalize(query).split()))
+        start = int(offset) if offset.isdigit() else 0
+        page = [self.article(qid) for qid in qids[start:start + PAGE_SIZE]]
+        next_offset = str(start + PAGE_SIZE) if start + PAGE_SIZE < len(qids) else ""
+        return page, next_offset
+
+    def check(self, qid: int, option: int) -> Optional[str]:
+        question = self.questions.get(qid)
+        if question is None or option >= len(question.labels):
+            return None
+        if question.correct_mask >> option & 1:
+            verdict = "✅ Правильно!"
+        else:
+            verdict = "❌ Неправильно."
+        if len(question.correct_labels) > 1:
+            verdict += f"\nПравильних варіантів у цьому питанні: {len(question.correct_labels)}."
+        return verdict
@@ -0,0 +1,234 @@
+import os
+import selectors
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from types import CodeType
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from callbacks import unpack
+
+# Профілювання на вимогу: поки сесія не запущена, нічого не зареєстровано — ні middleware,
+# ні потоку, ні tracemalloc, тож у звичайному режимі накладних витрат немає.
+# CPU рахується семплюванням стеку головного потоку: у asyncio стек бачить лише код, що
+# справді виконується, тож семпли чесно діляться між обробниками навіть при переплетенні задач.
+# Семпли, де цикл подій чекає в selector.select, — це простій, а не CPU: їх лише рахуємо окремо.
+
+DEFAULT_INTERVAL = 0.005
+TRACE_FRAMES = 25
+OUTSIDE = "(поза обробниками)"
+
+Stack = Tuple[CodeType, ...]
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float = DEFAULT_INTERVAL):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.idle = 0
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None and frame.f_code.co_filename == selectors.__file__:
+                self.idle += 1
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            # Найглибший кадр першим
+            self.stacks[tuple(stack)] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+class HandlerTimer(BaseMiddleware):
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.wall: Dict[str, float] = defaultdict(float)
+        self.wall_max: Dict[str, float] = defaultdict(float)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = handler_name(event, data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.calls[name] += 1
+            self.wall[name] += elapsed
+            self.wall_max[name] = max(self.wall_max[name], elapsed)
+
+
+def handler_name(event: TelegramObject, data: Dict[str, Any]) -> str:
+    handler = data.get("handler")
+    name = handler.callback.__name__ if handler is not None else type(event).__name__
+    if isinstance(event, CallbackQuery):
+        payload = unpack(event.data)
+        if payload is not None:
+            name += f":{payload.action.name.lower()}"
+    return name
+
+
+def short_path(filename: str) -> str:
+    # "pydantic/main.py" інформативніше за просто "main.py" і коротше за повний шлях
+    return os.path.join(*os.path.normpath(filename).split(os.sep)[-2:])
+
+
+def frame_label(code: CodeType) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+class CodeIndex:
+    # Для рядків з tracemalloc (файл + номер рядка) знаходимо функцію-обробник, якій вони належать
+    def __init__(self, handlers: Dict[CodeType, str]):
+        self.handlers = handlers
+        self.ranges: Dict[str, List[Tuple[int, int, str]]] = defaultdict(list)
+        for code, name in handlers.items():
+            lines = [line for _, _, line in code.co_lines() if line is not None]
+            self.ranges[code.co_filename].append((code.co_firstlineno, max(lines, default=code.co_firstlineno), name))
+
+    def for_stack(self, stack: Stack) -> str:
+        for code in stack:
+            name = self.handlers.get(code)
+            if name is not None:
+                return name
+        return OUTSIDE
+
+    def for_traceback(self, traceback: tracemalloc.Traceback) -> str:
+        # tracemalloc зберігає кадри від найстарішого, а нам потрібен найглибший обробник
+        for frame in reversed(traceback):
+            for first, last, name in self.ranges.get(frame.filename, ()):
+                if first <= frame.lineno <= last:
+                    return name
+        return OUTSIDE
+
+
+class ProfileReport:
+    def __init__(self, duration: float, interval: float, stacks: Counter, idle: int, timer: HandlerTimer,
+                 allocations: Dict[str, Tuple[int, int]], top_lines: List[tracemalloc.StatisticDiff],
+                 index: CodeIndex):
+        self.duration = duration
+        self.interval = interval
+        self.stacks = stacks
+        self.idle = idle
+        self.timer = timer
+        self.allocations = allocations
+        self.top_lines = top_lines
+        self.index = index
+
+    def folded(self) -> str:
+        # Формат flamegraph.pl / speedscope: "корінь;...;листок кількість"
+        lines = [
+            ";".join(frame_label(code) for code in reversed(stack)) + f" {count}"
+            for stack, count in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def cpu_by_handler(self) -> Counter:
+        cpu: Counter = Counter()
+        for stack, count in self.stacks.items():
+            cpu[self.index.for_stack(stack)] += count
+        return cpu
+
+    def summary(self, top: int = 10) -> str:
+        samples = sum(self.stacks.values())
+        lines = [
+            f"🔬 Профіль за {self.duration:.0f} с, семпли по {self.interval * 1000:.0f} мс",
+            f"Робота: {samples} семплів, простій циклу подій: {self.idle} "
+            f"({self.idle / max(samples + self.idle, 1):.0%})",
+            "",
+        ]
+
+        lines.append("CPU за обробниками:")
+        for name, count in self.cpu_by_handler().most_common(top):
+            lines.append(f"  {name}: {count * self.interval * 1000:.0f} мс ({count / max(samples, 1):.0%})")
+
+        lines.append("")
+        lines.append("Виклики (кількість, сумарно / макс. мс):")
+        for name, calls in self.timer.calls.most_common(top):
+            lines.append(
+                f"  {name}: {calls}, {self.timer.wall[name] * 1000:.0f} / {self.timer.wall_max[name] * 1000:.1f}"
+            )
+
+        lines.append("")
+        lines.append("Пам'ять за обробниками (приріст KB, блоків):")
+        ranked = sorted(self.allocations.items(), key=lambda item: -item[1][0])[:top]
+        for name, (size, count) in ranked:
+            lines.append(f"  {name}: {size / 1024:+.1f} KB, {count:+d}")
+
+        lines.append("")
+        lines.append("Найбільший приріст пам'яті за рядками:")
+        for stat in self.top_lines[:top]:
+            frame = stat.traceback[0]
+            lines.append(f"  {short_path(frame.filename)}:{frame.lineno}: {stat.size_diff / 1024:+.1f} KB")
+        return "\n".join(lines)
+
+
+class ProfileSession:
+    def __init__(self, handlers: Dict[CodeType, str], interval: float = DEFAULT_INTERVAL):
+        self.index = CodeIndex(handlers)
+        self.interval = interval
+        self.timer = HandlerTimer()
+        self.sampler: Optional[StackSampler] = None
+        self.observers: Sequence = ()
+        self.started = 0.0
+        self.duration = 0.0
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._owns_tracemalloc = False
+
+    def start(self, observers: Iterable) -> None:
+        self.observers = tuple(observers)
+        for observer in self.observers:
+            observer.middleware.register(self.timer)
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start(TRACE_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+        self.sampler = StackSampler(threading.get_ident(), self.interval)
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self) -> None:
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+        for observer in self.observers:
+            observer.middleware.unregister(self.timer)
+
+    # Знімок пам'яті й порівняння трас по 25 кадрів займають секунди CPU — викликати поза циклом подій
+    def report(self) -> ProfileReport:
+        snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        # Власні структури профайлера не рахуємо
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        snapshot = snapshot.filter_traces(ignore)
+        baseline = self._baseline.filter_traces(ignore)
+        allocations: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        for stat in snapshot.compare_to(baseline, "traceback"):
+            entry = allocations[self.index.for_traceback(stat.traceback)]
+            entry[0] += stat.size_diff
+            entry[1] += stat.count_diff
+        top_lines = snapshot.compare_to(baseline, "lineno")
+        self._baseline = None
+        return ProfileReport(
+            self.duration, self.interval, self.sampler.stacks, self.sampler.idle, self.timer,
+            {name: (size, count) for name, (size, count) in allocations.items()}, top_lines, self.index,
+        )
@@ -0,0 +1,71 @@
+import functools
+from typing import Optional, Tuple
+
+from bank import Question
+
+# Рендер для parse_mode="Markdown" (legacy). Текст з банку й від користувачів екранується,
+# щоб символи _ * ` [ не ламали розмітку. Фрагменти питань готуються один раз,
+# а блоки деталей кешуються за (питання, маска вибору) і діляться між користувачами.
+
+_ESCAPE = str.maketrans({"_": "\\_", "*": "\\*", "`": "\\`", "[": "\\["})
+
+
+def escape(text: str) -> str:
+    return text.translate(_ESCAPE)
+
+
+def bold(text: str) -> str:
+    # Усередині сутності екранування не працює, тож зірочку виносимо між двома жирними шматками
+    return "\\*".join(f"*{part}*" if part else "" for part in text.split("*"))
+
+
+class QuestionFragments:
+    __slots__ = ("title", "labels")
+
+    def __init__(self, question: Question):
+        self.title = f"❌ {bold(question.text)}"
+        self.labels: Tuple[str, ...] = tuple(escape(label) for label in question.labels)
+
+
+@functools.lru_cache(maxsize=None)
+def fragments(question: Question) -> QuestionFragments:
+    return QuestionFragments(question)
+
+
+@functools.lru_cache(maxsize=4096)
+def details(question: Question, selected: int) -> str:
+    parts = fragments(question)
+    lines = [parts.title]
+    lines.extend(
+        f"{'☑️' if selected >> i & 1 else '🔘'} {label}"
+        for i, label in enumerate(parts.labels)
+    )
+    chosen = [label for i, label in enumerate(parts.labels) if selected >> i & 1] or ["—"]
+    correct = [label for i, label in enumerate(parts.labels) if question.correct_mask >> i & 1]
+    lines.append("")
+    lines.append(f"_Твоя відповідь:_ {', '.join(chosen)}")
+    lines.append(f"_Правильна відповідь:_ {', '.join(correct)}")
+    return "\n".join(lines)
+
+
+def grade(percent: int) -> str:
+    if percent >= 90:
+        return "💯 Відмінно"
+    if percent >= 70:
+        return "👍 Добре"
+    if percent >= 50:
+        return "👌 Задовільно"
+    return "❌ Погано"
+
+
+def result(correct: int, total: int, percent: int, valid_until: Optional[str] = None) -> str:
+    lines = [
+        "📊 *Результат тесту:*",
+        "",
+        f"✅ *Правильних відповідей:* {correct} з {total}",
+        f"📈 *Успішність:* {percent}%",
+        f"🏆 *Оцінка:* {grade(percent)}",
+    ]
+    if valid_until is not None:
+        lines.append(f"🎓 *Тест зараховано до:* {valid_until}")
+    return "\n".join(lines)
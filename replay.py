@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import datetime
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.default import Default
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetChatMember, GetMe
+from aiogram.types import (
+    Chat, ChatMemberAdministrator, ChatMemberMember, InputFile, Message, TelegramObject, Update, User,
+)
+
+import fileio
+from callbacks import Action, pack, unpack
+
+# Запис і відтворення реального потоку апдейтів.
+# Запис (RECORD_UPDATES=updates.jsonl.gz): кожен апдейт — рядок [unix-мс, update] у gzip.
+# ID користувачів і чатів замінюються псевдонімами HMAC(RECORD_SALT, id), імена й юзернейми прибираються.
+# Відтворення: python replay.py run updates.jsonl.gz --speed 10 --out new.json
+#              python replay.py compare old.json new.json
+
+VOLATILE_KEYS = ("deadline", "question_deadline")
+CHAT_TYPES = ("private", "group", "supergroup", "channel")
+GROUP_ACTIONS = (Action.GROUP_VOTE, Action.GROUP_NEXT, Action.GROUP_STOP)
+
+
+def pseudonym(salt: bytes, value: int) -> int:
+    digest = hmac.new(salt, str(value).encode(), hashlib.sha256).digest()
+    alias = int.from_bytes(digest[:4], "big") & 0x7FFFFFFF or 1
+    return -alias if value < 0 else alias
+
+
+class Anonymizer:
+    def __init__(self, salt: bytes, keep: Iterable[int] = ()):
+        self.salt = salt
+        # Адміни й чати орендарів — це конфіг, а не дані користувачів; без них адмінські сценарії не відтворяться
+        self.keep = frozenset(keep)
+
+    def alias(self, value: int) -> int:
+        return value if value in self.keep else pseudonym(self.salt, value)
+
+    def scrub(self, node: Any) -> Any:
+        if isinstance(node, list):
+            return [self.scrub(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        # User має is_bot, Chat — type; в обох id і персональні поля
+        if "id" in node and ("is_bot" in node or node.get("type") in CHAT_TYPES):
+            node = {key: value for key, value in node.items() if key not in ("last_name", "bio")}
+            node["id"] = self.alias(node["id"])
+            if "first_name" in node:
+                node["first_name"] = "User"
+            if "username" in node:
+                node["username"] = f"u{abs(node['id'])}"
+            if "title" in node:
+                node["title"] = "Chat"
+        return {
+            key: self.alias(value) if key in ("chat_id", "user_id") and isinstance(value, int) else self.scrub(value)
+            for key, value in node.items()
+        }
+
+
+# Кожна пачка рядків — окремий gzip-член. Один потік на весь запис без завершального маркера
+# не читався б після SIGKILL чи OOM; з членами втрачається хіба що недописана остання пачка.
+class GzipMembers:
+    def __init__(self, path: str):
+        self._file = open(path, "ab")
+
+    def write(self, text: str) -> None:
+        self._file.write(gzip.compress(text.encode("utf-8")))
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# Зовнішній middleware: пише апдейт до того, як його побачать фільтри й обробники
+class UpdateRecorder(BaseMiddleware):
+    def __init__(self, path: str, salt: Optional[bytes] = None, keep: Iterable[int] = ()):
+        self.path = path
+        self.anonymizer = Anonymizer(salt or os.urandom(16), keep)
+        # Запис іде через пул файлового I/O; рядки, що прийшли за час попереднього запису, стискаються однією пачкою
+        self._log = fileio.appender(path, lambda: GzipMembers(path))
+
+    def record(self, update: Update, when: float) -> None:
+        payload = self.anonymizer.scrub(update.model_dump(mode="json", exclude_none=True, by_alias=True))
+        self._log.write(json.dumps([int(when * 1000), payload], ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    async def close(self) -> None:
+        await self._log.close()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.record(event, time.time())
+        return await handler(event, data)
+
+
+def read_recording(path: str) -> Iterator[Tuple[int, dict]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    when, update = json.loads(line)
+                except ValueError:
+                    # Обрізаний рядок після падіння процесу
+                    continue
+                yield when, update
+        except (EOFError, gzip.BadGzipFile):
+            # Недописаний останній gzip-член (або старий запис одним потоком без кінця)
+            return
+
+
+def describe_call(method) -> dict:
+    params = {}
+    for name, value in method:
+        if value is None or isinstance(value, Default):
+            continue
+        if isinstance(value, InputFile):
+            value = {"file": value.filename}
+        elif hasattr(value, "model_dump"):
+            value = value.model_dump(mode="json", exclude_none=True)
+        params[name] = value
+    return json.loads(json.dumps(params, ensure_ascii=False, default=repr))
+
+
+# Фейковий Bot API: нічого не відправляє, лише записує виклики й повертає правдоподібні відповіді
+# того типу, який чекає метод. Статус у чаті з запису не відомий: адмінами груп вважаються лише
+# користувачі з chat_admins (ID з запису, тобто вже псевдоніми), решта — звичайні учасники.
+class FakeSession(BaseSession):
+    def __init__(self, chat_admins: Iterable[int] = ()):
+        super().__init__()
+        self.calls: List[list] = []
+        self.current = -1
+        self.chat_admins = frozenset(chat_admins)
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append([self.current, method.__api_method__, describe_call(method)])
+        returning = method.__returning__
+        if returning is Message:
+            return self._message(method)
+        if returning == list[Message]:
+            return [self._message(method) for _ in getattr(method, "media", ())]
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="Replay", username="replay_bot")
+        if isinstance(method, GetChatMember):
+            user = User(id=method.user_id, is_bot=False, first_name="User")
+            if method.user_id in self.chat_admins:
+                permissions = {name: False for name in ChatMemberAdministrator.model_fields if name.startswith("can_")}
+                return ChatMemberAdministrator(user=user, is_anonymous=False, **permissions)
+            return ChatMemberMember(user=user)
+        return True
+
+    def _message(self, method) -> Message:
+        chat_id = getattr(method, "chat_id", None)
+        return Message(
+            message_id=next(self._message_ids),
+            date=datetime.datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+            text=getattr(method, "text", None),
+        )
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def dump_states(storage) -> Dict[str, dict]:
+    states = {}
+    for key, record in storage.sessions.items():
+        data = {name: value for name, value in record.data.items() if name not in VOLATILE_KEYS}
+        states[f"{key.chat_id}:{key.user_id}"] = {"state": record.state, "data": data}
+    return json.loads(json.dumps(states, ensure_ascii=False, default=repr))
+
+
+# Nonce сесії в записі — з бойового random, а під час відтворення інший. Перший побачений nonce
+# кожної сесії прив'язуємо до поточного nonce відтвореної сесії, інакше всі кнопки були б "застарілі".
+async def translate_callback(payload: dict, dp, bot, groups, nonces: Dict[Tuple[int, int, int], int]) -> None:
+    query = payload.get("callback_query")
+    decoded = unpack(query.get("data")) if query else None
+    if decoded is None or decoded.action == Action.PRACTICE or "message" not in query:
+        return
+    chat_id, user_id = query["message"]["chat"]["id"], query["from"]["id"]
+    if decoded.action in GROUP_ACTIONS:
+        # Груповий тест один на чат, тож і nonce прив'язуємо до чату
+        user_id = 0
+    key = (chat_id, user_id, decoded.nonce)
+    if key not in nonces:
+        if decoded.action in GROUP_ACTIONS:
+            quiz = groups.by_chat.get(chat_id)
+            nonces[key] = quiz.nonce if quiz is not None else decoded.nonce
+        else:
+            data = await dp.fsm.get_context(bot, chat_id, user_id).get_data()
+            nonces[key] = data.get("nonce", decoded.nonce)
+    query["data"] = pack(decoded.action, decoded.qid, nonces[key], decoded.arg)
+
+
+async def replay(path: str, speed: float, max_gap: float, chat_admins: Iterable[int] = ()) -> dict:
+    import main
+
+    session = FakeSession(chat_admins)
+    main.bot.session = session
+    timers_task = asyncio.create_task(main.timers.run())
+    latencies: List[float] = []
+    errors: Dict[int, str] = {}
+    nonces: Dict[Tuple[int, int, int], int] = {}
+    previous: Optional[int] = None
+    started = time.perf_counter()
+    for index, (when, payload) in enumerate(read_recording(path)):
+        if speed > 0 and previous is not None:
+            await asyncio.sleep(min((when - previous) / 1000, max_gap) / speed)
+        previous = when
+        await translate_callback(payload, main.dp, main.bot, main.group_quizzes, nonces)
+        update = Update.model_validate(payload)
+        session.current = index
+        tick = time.perf_counter()
+        try:
+            await main.dp.feed_update(main.bot, update)
+        except Exception as e:
+            # Падіння обробника — теж результат відтворення: фіксуємо його і йдемо далі
+            errors[index] = type(e).__name__
+        latencies.append((time.perf_counter() - tick) * 1000)
+    # Даємо дописатися фоновим задачам (розсилки), але не чекаємо таймерів іспиту вічно
+    pending = list(main.broadcasts._tasks.values())
+    if pending:
+        await asyncio.wait(pending, timeout=max_gap)
+    timers_task.cancel()
+    await fileio.close_all()
+    return {
+        "updates": len(latencies),
+        "wall": time.perf_counter() - started,
+        "latency_ms": latencies,
+        "calls": session.calls,
+        "errors": errors,
+        "states": dump_states(main.storage),
+    }
+
+
+def run(args) -> int:
+    recording = os.path.abspath(args.recording)
+    out = os.path.abspath(args.out)
+    # Бот пише логи, спроби й чекпоінти у поточну теку — відтворюємо в чистій, щоб не зачепити бойові файли
+    workdir = args.workdir or tempfile.mkdtemp(prefix="replay-")
+    if os.path.exists("tenants.json"):
+        shutil.copy("tenants.json", workdir)
+    os.chdir(workdir)
+    os.environ["token"] = "123456:REPLAY"
+    random.seed(args.seed)
+    result = asyncio.run(replay(recording, args.speed, args.max_gap, args.chat_admin))
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    print(f"{result['updates']} updates, {len(result['calls'])} API calls, {len(result['errors'])} errors "
+          f"in {result['wall']:.2f}s -> {out}")
+    print(format_latency(result["latency_ms"]))
+    return 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def format_latency(values: List[float]) -> str:
+    mean = statistics.fmean(values) if values else 0.0
+    return (
+        f"latency ms: mean {mean:.2f}, p50 {percentile(values, 0.5):.2f}, "
+        f"p95 {percentile(values, 0.95):.2f}, p99 {percentile(values, 0.99):.2f}, max {max(values, default=0):.2f}"
+    )
+
+
+def group_calls(calls: List[list]) -> Dict[int, List[list]]:
+    grouped: Dict[int, List[list]] = {}
+    for index, method, params in calls:
+        grouped.setdefault(index, []).append([method, params])
+    return grouped
+
+
+def compare(args) -> int:
+    with open(args.old, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"old: {format_latency(old['latency_ms'])}")
+    print(f"new: {format_latency(new['latency_ms'])}")
+    old_p95 = percentile(old["latency_ms"], 0.95)
+    if old_p95:
+        print(f"p95 change: {(percentile(new['latency_ms'], 0.95) / old_p95 - 1) * 100:+.1f}%")
+    print(f"API calls: {len(old['calls'])} -> {len(new['calls'])}")
+
+    old_calls = group_calls(old["calls"])
+    new_calls = group_calls(new["calls"])
+    differing = [index for index in sorted(set(old_calls) | set(new_calls)) if old_calls.get(index) != new_calls.get(index)]
+    for index in differing[:args.limit]:
+        print(f"\nupdate #{index}:")
+        print(f"  old: {json.dumps(old_calls.get(index, []), ensure_ascii=False)[:500]}")
+        print(f"  new: {json.dumps(new_calls.get(index, []), ensure_ascii=False)[:500]}")
+    print(f"\n{len(differing)} updates with different outgoing calls")
+
+    # Ключі після JSON — рядки; записи без "errors" зроблені до появи поля
+    old_errors, new_errors = old.get("errors", {}), new.get("errors", {})
+    failing = [index for index in sorted(set(old_errors) | set(new_errors), key=int) if old_errors.get(index) != new_errors.get(index)]
+    for index in failing[:args.limit]:
+        print(f"update #{index}: {old_errors.get(index, 'ok')} -> {new_errors.get(index, 'ok')}")
+    print(f"{len(failing)} updates with different handler errors")
+
+    old_states, new_states = old["states"], new["states"]
+    changed = [key for key in sorted(set(old_states) | set(new_states)) if old_states.get(key) != new_states.get(key)]
+    for key in changed[:args.limit]:
+        print(f"state {key}: {old_states.get(key)} -> {new_states.get(key)}")
+    print(f"{len(changed)} sessions with different final FSM state")
+    return 1 if differing or failing or changed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded updates against a fake Bot API and compare builds")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay a recording through this build")
+    run_parser.add_argument("recording")
+    run_parser.add_argument("--out", default="replay.json")
+    run_parser.add_argument("--speed", type=float, default=0, help="1 = real time, 10 = ten times faster, 0 = no pauses")
+    run_parser.add_argument("--max-gap", type=float, default=5, help="cap on a single pause between updates, seconds")
+    run_parser.add_argument("--seed", type=int, default=0, help="seed for quiz nonces and option shuffles")
+    run_parser.add_argument("--workdir", help="directory for the bot's files (default: fresh temp dir)")
+    run_parser.add_argument("--chat-admin", type=int, action="append", default=[],
+                            help="recorded user ID that getChatMember reports as a group admin (repeatable)")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two replay results")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--limit", type=int, default=10, help="how many differences to print")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
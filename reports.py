@@ -0,0 +1,126 @@
+import csv
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Звіти будуються в окремому процесі (ProcessPoolExecutor), тому тут лише
+# функції верхнього рівня з простими аргументами, які можна передати через pickle.
+
+ATTEMPT_COLUMNS = ["Дата", "Користувач", "Username", "User ID", "Розділ", "Правильних", "Всього", "Успішність, %", "Режим"]
+QUESTION_COLUMNS = ["Розділ", "№", "Питання", "Спроб", "Помилок", "Частка помилок, %"]
+
+# Розділ -> стабільний ID питання -> (поточний номер у розділі або None для видаленого, текст)
+QuestionTexts = Dict[str, Dict[int, Tuple[Optional[int], str]]]
+
+# Поле "mode" спроби: quiz, exam, group, web або practice (офлайн-пакет). Відповіді практики
+# можна перевірити заздалегідь, тож вона не зараховується як здача і не входить у частку помилок.
+# Спроби без поля записані до його появи — це звичайні тести.
+MODE_PRACTICE = "practice"
+
+
+def counts_as_test(attempt: dict) -> bool:
+    return attempt.get("mode") != MODE_PRACTICE
+
+
+def iter_attempts(path: str) -> Iterator[dict]:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def attempt_row(attempt: dict) -> list:
+    return [
+        datetime.fromtimestamp(attempt["ts"]).strftime("%Y-%m-%d %H:%M"),
+        attempt.get("full_name", ""),
+        attempt.get("username", ""),
+        attempt["user_id"],
+        attempt["category"],
+        attempt["correct"],
+        attempt["total"],
+        attempt["percent"],
+        attempt.get("mode", "quiz"),
+    ]
+
+
+class FailureStats:
+    def __init__(self):
+        self.asked = defaultdict(int)
+        self.failed = defaultdict(int)
+
+    def add(self, attempt: dict) -> None:
+        if not counts_as_test(attempt):
+            return
+        category = attempt["category"]
+        for qid in attempt.get("asked", []):
+            self.asked[(category, qid)] += 1
+        for qid in attempt.get("failed", []):
+            self.failed[(category, qid)] += 1
+
+    def rows(self, question_texts: QuestionTexts) -> Iterator[list]:
+        rows = []
+        for (category, qid), asked in self.asked.items():
+            failed = self.failed[(category, qid)]
+            number, text = question_texts.get(category, {}).get(qid, (None, ""))
+            row = [category, number or "", text, asked, failed, round(failed / asked * 100, 1)]
+            # Порядок як у банку зараз, видалені питання — в кінці розділу
+            rows.append((category, number is None, number or 0, qid, row))
+        for *_, row in sorted(rows):
+            yield row
+
+
+def build_csv(attempts_path: str, out_dir: str, question_texts: QuestionTexts) -> List[str]:
+    attempts_file = os.path.join(out_dir, "attempts.csv")
+    questions_file = os.path.join(out_dir, "questions.csv")
+    stats = FailureStats()
+    # utf-8-sig — щоб Excel відкривав кирилицю без танців
+    with open(attempts_file, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(ATTEMPT_COLUMNS)
+        for attempt in iter_attempts(attempts_path):
+            writer.writerow(attempt_row(attempt))
+            stats.add(attempt)
+    with open(questions_file, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(QUESTION_COLUMNS)
+        writer.writerows(stats.rows(question_texts))
+    return [attempts_file, questions_file]
+
+
+def build_xlsx(attempts_path: str, out_dir: str, question_texts: QuestionTexts) -> List[str]:
+    from openpyxl import Workbook
+
+    path = os.path.join(out_dir, "report.xlsx")
+    workbook = Workbook(write_only=True)
+    attempts_sheet = workbook.create_sheet("Спроби")
+    questions_sheet = workbook.create_sheet("Питання")
+    stats = FailureStats()
+    attempts_sheet.append(ATTEMPT_COLUMNS)
+    for attempt in iter_attempts(attempts_path):
+        attempts_sheet.append(attempt_row(attempt))
+        stats.add(attempt)
+    questions_sheet.append(QUESTION_COLUMNS)
+    for row in stats.rows(question_texts):
+        questions_sheet.append(row)
+    workbook.save(path)
+    return [path]
+
+
+def build_report(attempts_path: str, out_dir: str, fmt: str, question_texts: QuestionTexts) -> List[str]:
+    if fmt == "xlsx":
+        return build_xlsx(attempts_path, out_dir, question_texts)
+    return build_csv(attempts_path, out_dir, question_texts)
+
+
+def xlsx_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,123 @@
+import bisect
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from bank import Question
+
+APOSTROPHES = "'’‘ʼ`´"
+NUMBERING = re.compile(r"^\s*\d+\s*[).]\s*")
+WORD = re.compile(r"\w+")
+_APOSTROPHE_TABLE = str.maketrans("", "", APOSTROPHES)
+
+
+def normalize(text: str) -> str:
+    # "5) Обов’язки" і "обовязки" мають давати однаковий результат
+    text = NUMBERING.sub("", text)
+    return text.casefold().translate(_APOSTROPHE_TABLE).replace("ё", "е")
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(normalize(text))
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchHit(NamedTuple):
+    category: str
+    position: int
+    question: Question
+    score: float
+
+
+# Інвертований індекс по словах питань і варіантів + триграмний індекс по словнику
+# для нечіткого пошуку (опечатки, інші закінчення). Триграми рахуються по словах,
+# а не по документах, тож кандидатів мало навіть на великих банках.
+class SearchIndex:
+    QUESTION_WEIGHT = 2.0
+    OPTION_WEIGHT = 1.0
+
+    def __init__(self):
+        self.docs: List[Tuple[str, int, Question]] = []
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.term_trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self.vocabulary: List[str] = []
+
+    @classmethod
+    def build(cls, sections: Dict[str, Iterable[Question]]) -> "SearchIndex":
+        index = cls()
+        for category, questions in sections.items():
+            for position, question in enumerate(questions):
+                index.add(category, position, question)
+        index.finalize()
+        return index
+
+    def add(self, category: str, position: int, question: Question) -> None:
+        doc_id = len(self.docs)
+        self.docs.append((category, position, question))
+        weights = Counter()
+        for term in tokenize(question.text):
+            weights[term] += self.QUESTION_WEIGHT
+        for label in question.labels:
+            for term in tokenize(label):
+                weights[term] += self.OPTION_WEIGHT
+        for term, weight in weights.items():
+            self.postings[term][doc_id] = weight
+
+    def finalize(self) -> None:
+        self.vocabulary = sorted(self.postings)
+        self.term_trigrams.clear()
+        for term in self.vocabulary:
+            for gram in trigrams(term):
+                self.term_trigrams[gram].add(term)
+
+    def _expand(self, term: str, min_similarity: float) -> Dict[str, float]:
+        matches = {}
+        if term in self.postings:
+            matches[term] = 1.0
+        # Префікс: "вогнегас" знаходить "вогнегасник", "вогнегасники"
+        start = bisect.bisect_left(self.vocabulary, term)
+        for candidate in self.vocabulary[start:start + 50]:
+            if not candidate.startswith(term):
+                break
+            matches.setdefault(candidate, 0.9)
+        if len(term) < 3:
+            return matches
+        grams = trigrams(term)
+        overlap = Counter()
+        for gram in grams:
+            for candidate in self.term_trigrams.get(gram, ()):
+                overlap[candidate] += 1
+        for candidate, shared in overlap.items():
+            similarity = shared / (len(grams) + len(trigrams(candidate)) - shared)
+            if similarity >= min_similarity and similarity > matches.get(candidate, 0):
+                matches[candidate] = similarity
+        return matches
+
+    def search(self, query: str, limit: int = 10, min_similarity: float = 0.4) -> List[SearchHit]:
+        terms = tokenize(query)
+        if not terms or not self.docs:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+        total = len(self.docs)
+        for term in dict.fromkeys(terms):
+            best: Dict[int, float] = {}
+            for candidate, similarity in self._expand(term, min_similarity).items():
+                postings = self.postings[candidate]
+                idf = math.log(1 + total / len(postings))
+                for doc_id, weight in postings.items():
+                    score = similarity * weight * idf
+                    if score > best.get(doc_id, 0):
+                        best[doc_id] = score
+            for doc_id, score in best.items():
+                scores[doc_id] += score
+                matched[doc_id] += 1
+        # Спершу документи, що покривають більше слів запиту, потім за вагою
+        ranked = heapq.nsmallest(limit, scores, key=lambda doc_id: (-matched[doc_id], -scores[doc_id]))
+        return [SearchHit(*self.docs[doc_id], scores[doc_id]) for doc_id in ranked]
@@ -0,0 +1,129 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+def estimate_size(obj: Any) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in obj)
+    return size
+
+
+class SessionRecord:
+    __slots__ = ("state", "data", "touched", "size")
+
+    def __init__(self):
+        self.state: Optional[str] = None
+        self.data: Dict[str, Any] = {}
+        self.touched = time.monotonic()
+        self.size = 0
+
+
+# FSM-сховище в пам'яті з TTL, LRU-лімітом сесій і бюджетом пам'яті.
+# Записи лежать в OrderedDict у порядку останнього доступу, тож і LRU-витіснення,
+# і прибирання прострочених сесій беруть записи лише з початку черги.
+class SessionStorage(BaseStorage):
+    def __init__(
+        self,
+        ttl: float = 6 * 3600,
+        max_sessions: int = 10_000,
+        memory_budget: int = 64 * 1024 * 1024,
+        on_evict: Optional[Callable[[StorageKey, SessionRecord, str], None]] = None,
+        on_write: Optional[Callable[[StorageKey, Dict[str, Any]], None]] = None,
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.memory_budget = memory_budget
+        self.on_evict = on_evict
+        self.on_write = on_write
+        self.sessions: "OrderedDict[StorageKey, SessionRecord]" = OrderedDict()
+        self.memory_used = 0
+        self.stats = {"expired": 0, "evicted_lru": 0, "evicted_memory": 0}
+
+    def _get(self, key: StorageKey) -> Optional[SessionRecord]:
+        record = self.sessions.get(key)
+        if record is not None:
+            record.touched = time.monotonic()
+            self.sessions.move_to_end(key)
+        return record
+
+    def _get_or_create(self, key: StorageKey) -> SessionRecord:
+        record = self._get(key)
+        if record is None:
+            record = self.sessions[key] = SessionRecord()
+        return record
+
+    def _drop(self, key: StorageKey, reason: Optional[str] = None) -> None:
+        record = self.sessions.pop(key)
+        self.memory_used -= record.size
+        if reason is None:
+            return
+        self.stats[reason] += 1
+        if self.on_evict is not None:
+            self.on_evict(key, record, reason)
+
+    def _drop_if_empty(self, key: StorageKey, record: SessionRecord) -> None:
+        if record.state is None and not record.data:
+            self._drop(key)
+
+    def _enforce_limits(self) -> None:
+        while len(self.sessions) > self.max_sessions:
+            self._drop(next(iter(self.sessions)), "evicted_lru")
+        while self.memory_used > self.memory_budget and len(self.sessions) > 1:
+            self._drop(next(iter(self.sessions)), "evicted_memory")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._get_or_create(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._drop_if_empty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = self._get_or_create(key)
+        record.data = dict(data)
+        self.memory_used -= record.size
+        record.size = estimate_size(record.data)
+        self.memory_used += record.size
+        if self.on_write is not None:
+            self.on_write(key, record.data)
+        self._drop_if_empty(key, record)
+        self._enforce_limits()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return record.data.copy() if record is not None else {}
+
+    def sweep(self, limit: int = 1000) -> int:
+        deadline = time.monotonic() - self.ttl
+        swept = 0
+        while self.sessions and swept < limit:
+            key, record = next(iter(self.sessions.items()))
+            if record.touched > deadline:
+                break
+            self._drop(key, "expired")
+            swept += 1
+        return swept
+
+    async def run_sweeper(self, interval: float = 60) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            # Великі пачки прострочених сесій розбиваємо, щоб не тримати цикл подій
+            while self.sweep():
+                await asyncio.sleep(0)
+
+    async def close(self) -> None:
+        # aiogram закриває сховище першим shutdown-хуком, а обробники в польоті ще дочитують
+        # і дописують сесії, поки ми чекаємо на них. Пам'ять звільниться разом із процесом.
+        pass
+
@@ -0,0 +1,79 @@
+import builtins
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+
+# Профіль старту: STARTUP_PROFILE=1 або `python main.py --profile-startup`.
+# Час імпорту рахується на верхньорівневий пакет (включно з його залежностями),
+# тільки для першого завантаження і тільки в головному потоці.
+class StartupProfiler:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.imports = defaultdict(float)
+        self.phases = []
+        self._depth = 0
+        self._main_thread = threading.get_ident()
+        self._original_import = None
+
+    @classmethod
+    def from_env(cls) -> "StartupProfiler":
+        enabled = os.getenv("STARTUP_PROFILE") == "1" or "--profile-startup" in sys.argv
+        profiler = cls(enabled)
+        if enabled:
+            profiler.install()
+        return profiler
+
+    def install(self) -> None:
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        if self._depth or level or name in sys.modules or threading.get_ident() != self._main_thread:
+            return original(name, globals, locals, fromlist, level)
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.imports[name.partition(".")[0]] += time.perf_counter() - started
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._phase(name)
+
+    @contextlib.contextmanager
+    def _phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def report(self, top: int = 15) -> str:
+        total = time.perf_counter() - self.started
+        lines = [f"Startup profile: {total * 1000:.1f} ms until polling", "Imports:"]
+        for name, seconds in sorted(self.imports.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"  {seconds * 1000:8.1f} ms  {name}")
+        lines.append("Init:")
+        for name, seconds in self.phases:
+            lines.append(f"  {seconds * 1000:8.1f} ms  {name}")
+        return "\n".join(lines)
+
+    def finish(self) -> None:
+        if not self.enabled:
+            return
+        self.uninstall()
+        print(self.report(), file=sys.stderr)
@@ -0,0 +1,143 @@
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import fileio
+from bank import Question, compile_sections
+
+# Конфіг орендарів (TENANTS_PATH, за замовчуванням tenants.json), наприклад:
+# {"tenants": [{"id": "warehouse", "chats": [-1001234567890], "admins": [123],
+#               "sections": {"🎲QR🎲": "qr_questions"}, "log": "logs/warehouse.txt",
+#               "attempts": "logs/warehouse_attempts.jsonl"}]}
+# Банки вказуються назвою списку з questions.py. Чати без орендаря обслуговує орендар за замовчуванням.
+# Особисті чати (і inline-запити) визначаються за користувачем: адміністратор потрапляє до свого
+# орендаря, а учасник — до того, в чиїй групі писав востаннє (TENANT_MEMBERS_PATH пам'ятає це між запусками).
+
+
+class Tenant:
+    __slots__ = ("tenant_id", "sections", "admins", "log_path", "attempts_path")
+
+    def __init__(
+        self,
+        tenant_id: str,
+        sections: Dict[str, Sequence[Question]],
+        admins: Iterable[int],
+        log_path: str,
+        attempts_path: str,
+    ):
+        self.tenant_id = tenant_id
+        self.sections = sections
+        self.admins: FrozenSet[int] = frozenset(admins)
+        self.log_path = log_path
+        self.attempts_path = attempts_path
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.tenant_id!r})"
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+
+class TenantRegistry:
+    def __init__(self):
+        self.default: Optional[Tenant] = None
+        self.tenants: Dict[str, Tenant] = {}
+        self.by_chat: Dict[int, Tenant] = {}
+        self.by_admin: Dict[int, Tenant] = {}
+        self.by_member: Dict[int, Tenant] = {}
+        self.members_path: Optional[str] = None
+        # Однакові банки в різних орендарів компілюються один раз і діляться між ними
+        self._compiled: Dict[int, Tuple[list, Sequence[Question]]] = {}
+
+    def compile(self, raw_sections: Dict[str, list]) -> Dict[str, Sequence[Question]]:
+        missing = {label: raw for label, raw in raw_sections.items() if id(raw) not in self._compiled}
+        first_qid = sum(len(questions) for _, questions in self._compiled.values())
+        for label, questions in compile_sections(missing, first_qid=first_qid).items():
+            self._compiled[id(missing[label])] = (missing[label], questions)
+        return {label: self._compiled[id(raw)][1] for label, raw in raw_sections.items()}
+
+    def compiled(self, raw: list) -> Optional[Sequence[Question]]:
+        entry = self._compiled.get(id(raw))
+        return entry[1] if entry is not None else None
+
+    def raw_banks(self) -> List[list]:
+        return [raw for raw, _ in self._compiled.values()]
+
+    def add(self, tenant: Tenant, chats: Iterable[int] = (), default: bool = False) -> None:
+        self.tenants[tenant.tenant_id] = tenant
+        if default:
+            self.default = tenant
+        else:
+            for admin_id in tenant.admins:
+                self.by_admin.setdefault(admin_id, tenant)
+        for chat_id in chats:
+            self.by_chat[chat_id] = tenant
+
+    def for_chat(self, chat_id: Optional[int], user_id: Optional[int] = None) -> Tenant:
+        tenant = self.by_chat.get(chat_id)
+        if tenant is None:
+            tenant = self.by_admin.get(user_id) or self.by_member.get(user_id) or self.default
+        return tenant
+
+    def load_members(self, path: str) -> None:
+        self.members_path = path
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                tenant = self.tenants.get(entry["tenant"])
+                if tenant is not None:
+                    self.by_member[entry["user_id"]] = tenant
+
+    def remember(self, user_id: int, tenant: Tenant) -> None:
+        if self.by_member.get(user_id) is tenant:
+            return
+        self.by_member[user_id] = tenant
+        if self.members_path is not None:
+            fileio.appender(self.members_path).write(json.dumps({"user_id": user_id, "tenant": tenant.tenant_id}) + "\n")
+
+    def load(self, path: str, banks: Dict[str, list]) -> None:
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        for entry in config.get("tenants", []):
+            raw_sections = {label: banks[bank_name] for label, bank_name in entry["sections"].items()}
+            tenant = Tenant(
+                tenant_id=entry["id"],
+                sections=self.compile(raw_sections),
+                admins=entry.get("admins", []),
+                log_path=entry.get("log", f"logs_{entry['id']}.txt"),
+                attempts_path=entry.get("attempts", f"attempts_{entry['id']}.jsonl"),
+            )
+            self.add(tenant, entry.get("chats", []))
+
+
+# Визначає орендаря один раз на апдейт і передає його в обробники як `tenant`
+class TenantMiddleware(BaseMiddleware):
+    def __init__(self, registry: TenantRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        tenant = self.registry.by_chat.get(chat.id) if chat is not None else None
+        if tenant is not None:
+            if user is not None:
+                self.registry.remember(user.id, tenant)
+        else:
+            tenant = self.registry.for_chat(None, user.id if user is not None else None)
+        data["tenant"] = tenant
+        return await handler(event, data)
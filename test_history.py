@@ -0,0 +1,65 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import fileio
+from history import HistoryStore, decode_attempt, encode_attempt, read_varint, unzigzag, write_varint, zigzag
+
+
+class VarintTest(unittest.TestCase):
+    def test_varint_round_trip(self):
+        for value in (0, 1, 127, 128, 300, 16383, 16384, 2 ** 35 + 7):
+            out = bytearray()
+            write_varint(out, value)
+            self.assertEqual(read_varint(out, 0), (value, len(out)))
+
+    def test_negative_varint_rejected(self):
+        with self.assertRaises(ValueError):
+            write_varint(bytearray(), -1)
+
+    def test_zigzag_round_trip(self):
+        for value in (0, 1, -1, 2, -2, 63, -64, 10 ** 9, -(10 ** 9)):
+            self.assertGreaterEqual(zigzag(value), 0)
+            self.assertEqual(unzigzag(zigzag(value)), value)
+
+    def test_attempt_round_trip(self):
+        out = bytearray()
+        encode_attempt(out, 3, -5, 2, [4, 1, 9], [1, 0, 6])
+        self.assertEqual(decode_attempt(out, 0), (3, -5, 2, (4, 1, 9), (1, 0, 6), len(out)))
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "history.bin")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, store, *attempts):
+        # add() пише через фоновий AppendLog, тож у тесті запускаємо його в циклі подій і чекаємо на запис
+        async def run():
+            for attempt in attempts:
+                store.add(*attempt)
+            await fileio.close_all()
+
+        asyncio.run(run())
+
+    def test_reload_and_torn_tail(self):
+        store = HistoryStore(self.path)
+        self.write(store, ("t", 1, "A", 1000, 2, [0, 1, 2], [1, 2, 4]), ("t", 1, "A", 1060, 3, [0, 1, 2], [1, 2, 4]))
+        size = os.path.getsize(self.path)
+        with open(self.path, "ab") as f:
+            f.write(b"\x30\x01\x02")
+
+        loaded = HistoryStore(self.path)
+        loaded.load()
+        self.assertEqual(loaded.attempts, 2)
+        self.assertEqual(loaded.last(1, 10), store.last(1, 10))
+        self.assertEqual(loaded.best(1), {"A": (3, 3, 1060)})
+        self.assertEqual(os.path.getsize(self.path), size)
+
+
+if __name__ == "__main__":
+    unittest.main()
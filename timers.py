@@ -0,0 +1,67 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Один планувальник на весь процес: купа дедлайнів і одна задача, що спить до найближчого.
+# Скасування ліниве — запис у купі ігнорується, якщо дедлайн ключа вже інший.
+# Час — unix timestamp, щоб дедлайни зі сховища лишались валідними після перезапуску.
+class TimerScheduler:
+    def __init__(self, callback: Callable[[Hashable], Awaitable[None]]):
+        self.callback = callback
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._deadlines: Dict[Hashable, float] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        # Цикл подій тримає задачі лише слабкими посиланнями — без цього спрацювання може зникнути посеред роботи
+        self._firing: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, key: Hashable, when: float) -> None:
+        if self._deadlines.get(key) == when:
+            return
+        self._deadlines[key] = when
+        heapq.heappush(self._heap, (when, next(self._counter), key))
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+        # Купа не повинна розростатись через скасовані записи
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(when, next(self._counter), key) for key, when in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def cancel(self, key: Hashable) -> None:
+        self._deadlines.pop(key, None)
+
+    def _pop_stale(self) -> None:
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    async def _fire(self, key: Hashable) -> None:
+        try:
+            await self.callback(key)
+        except Exception:
+            logger.exception("Timer callback failed for %s", key)
+
+    async def run(self) -> None:
+        while True:
+            self._pop_stale()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            if timeout is None or timeout > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            when, _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            task = asyncio.create_task(self._fire(key))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
@@ -0,0 +1,87 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+Key = Tuple[int, int]
+
+# Лічильник викликів Bot API на один тест. Власник виклику — (чат, користувач), якого обробник
+# тесту позначив через track(); він живе в ContextVar, тож паралельні обробники не плутаються.
+# Кожен апдейт починається без власника: команди поза тестом (/history, /export...) не рахуються.
+# Лічильник тесту відкривається на старті, після результату потрапляє в історію, але рахує далі —
+# перегляд деталей теж входить у ціну тесту. Закривається наступним стартом того ж користувача
+# або, якщо відкритих лічильників більше за max_open, — як найстаріший.
+class ApiCallMeter(BaseRequestMiddleware):
+    def __init__(self, history: int = 1000, max_open: int = 10000):
+        self.max_open = max_open
+        self._owner: ContextVar[Optional[Key]] = ContextVar("api_call_owner", default=None)
+        self.open: Dict[Key, List[int]] = {}
+        self.running: Dict[Key, List[int]] = {}
+        self.completed: Dict[str, Deque[List[int]]] = defaultdict(lambda: deque(maxlen=history))
+        self.total = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Any,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        self.total += 1
+        counter = self.open.get(self._owner.get())
+        if counter is not None:
+            counter[0] += 1
+        return await make_request(bot, method)
+
+    def track(self, key: Key) -> None:
+        self._owner.set(key)
+
+    # Виклики, що не входять у ціну тесту (сповіщення адмінам), робимо без власника
+    @contextmanager
+    def untracked(self) -> Iterator[None]:
+        token = self._owner.set(None)
+        try:
+            yield
+        finally:
+            self._owner.reset(token)
+
+    def start(self, key: Key) -> None:
+        self.track(key)
+        # Перевставляємо ключ, щоб порядок словника йшов від найстарішого старту
+        self.open.pop(key, None)
+        self.open[key] = self.running[key] = [0]
+        while len(self.open) > self.max_open:
+            stale = next(iter(self.open))
+            del self.open[stale]
+            self.running.pop(stale, None)
+
+    def finish(self, key: Key, mode: str) -> None:
+        counter = self.running.pop(key, None)
+        if counter is not None:
+            self.completed[mode].append(counter)
+
+    def summary(self, mode: str) -> Optional[Tuple[int, float, int]]:
+        calls = sorted(counter[0] for counter in self.completed.get(mode, ()))
+        if not calls:
+            return None
+        return len(calls), sum(calls) / len(calls), calls[min(len(calls) - 1, int(len(calls) * 0.95))]
+
+
+class ApiCallOwner(BaseMiddleware):
+    def __init__(self, meter: ApiCallMeter):
+        self.meter = meter
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Власника призначає обробник тесту, а попередній апдейт у тій самій задачі його не залишає
+        with self.meter.untracked():
+            return await handler(event, data)
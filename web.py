@@ -0,0 +1,118 @@
+import threading
+from typing import Callable, Optional
+
+from packs import PracticePacks
+from webquiz import SubmitError, WebQuiz
+
+# Сторінки пакетів адресуються хешем вмісту, тож клієнт може тримати їх у кеші скільки завгодно
+PACK_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def create_app(
+    healthy: Callable[[], bool] = lambda: True,
+    packs: Optional[PracticePacks] = None,
+    quiz: Optional[WebQuiz] = None,
+    media_dir: str = "media",
+):
+    from flask import Flask, Response, jsonify, request, send_from_directory
+
+    app = Flask(__name__)
+
+    @app.route("/")
+    def home():
+        return "Bot is running!"
+
+    # Під час зупинки віддаємо 503, щоб балансувальник/оркестратор перестав вважати інстанс живим
+    @app.route("/ping")
+    def ping():
+        if not healthy():
+            return "Draining", 503
+        return "OK", 200
+
+    @app.route("/pack/<pack_id>.html")
+    def practice_pack(pack_id):
+        pack = packs.get(pack_id) if packs is not None else None
+        if pack is None:
+            return "Not found", 404
+        response = Response(pack.body, mimetype="text/html")
+        response.set_etag(pack.etag)
+        response.headers["Cache-Control"] = PACK_CACHE_CONTROL
+        # Повторний запит з If-None-Match отримує 304 без тіла
+        return response.make_conditional(request)
+
+    if quiz is not None:
+        @app.route("/app.html")
+        def quiz_page():
+            return cached(quiz.page, "text/html", "public, max-age=3600")
+
+        # Кнопка з бота містить версію банку: поки вона збігається, клієнт бере банк з кешу без запиту
+        @app.route("/api/bank/<tenant_id>")
+        def quiz_bank(tenant_id):
+            # Банк віддаємо лише за підписаним посиланням з бота, як і приймаємо відповіді
+            if not quiz.authorized(tenant_id, request.args.get("k", "")):
+                return jsonify(error="Forbidden"), 403
+            payload = quiz.bank(tenant_id)
+            if payload is None:
+                return jsonify(error="Not found"), 404
+            cache = PACK_CACHE_CONTROL if request.args.get("v") == payload.etag else "no-cache"
+            return cached(payload, "application/json", cache)
+
+        @app.route("/api/submit", methods=["POST"])
+        def quiz_submit():
+            try:
+                return jsonify(quiz.submit(request.get_json(force=True, silent=True) or {}))
+            except SubmitError as e:
+                return jsonify(error=str(e)), e.status
+
+        @app.route("/media/<path:name>")
+        def quiz_media(name):
+            return send_from_directory(media_dir, name, max_age=86400)
+
+    def cached(payload, mimetype, cache_control):
+        gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+        response = Response(payload.gzipped if gzipped else payload.body, mimetype=mimetype)
+        if gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+        response.set_etag(payload.etag + ("-gz" if gzipped else ""))
+        response.headers["Cache-Control"] = cache_control
+        return response.make_conditional(request)
+
+    return app
+
+
+# Flask імпортується всередині потоку, тож не затримує старт бота
+class WebServer:
+    def __init__(self, host: str, port: int, healthy: Callable[[], bool], **routes):
+        self.host = host
+        self.port = port
+        self.healthy = healthy
+        self.routes = routes
+        self._server = None
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._serve, name="http-server", daemon=True)
+
+    def _serve(self) -> None:
+        from werkzeug.serving import make_server
+
+        try:
+            self._server = make_server(self.host, self.port, create_app(self.healthy, **self.routes), threaded=True)
+        finally:
+            self._ready.set()
+        self._server.serve_forever()
+
+    def stop(self, timeout: float = 5) -> None:
+        if self._ready.wait(timeout) and self._server is not None:
+            self._server.shutdown()
+        self.thread.join(timeout)
+
+
+def start_server(
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    healthy: Callable[[], bool] = lambda: True,
+    **routes,
+) -> WebServer:
+    server = WebServer(host, port, healthy, **routes)
+    server.thread.start()
+    return server
@@ -0,0 +1,261 @@
+import asyncio
+import concurrent.futures
+import gzip
+import hashlib
+import hmac
+import json
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from aiogram.utils.web_app import WebAppUser, safe_parse_webapp_init_data
+
+from bank import Question
+from tenants import Tenant, TenantRegistry
+
+# Тест у Telegram Web App: сторінка і банк вантажаться одним-двома запитами (і далі живуть у кеші),
+# відповіді збираються в браузері, а на сервер іде один POST з initData, який Telegram підписав
+# токеном бота. Правильних відповідей у банку немає — перевіряє сервер, тож результат можна зараховувати.
+
+INIT_DATA_MAX_AGE = 24 * 3600
+SUBMIT_TIMEOUT = 10
+HASH_CHARS = 16
+
+
+class Payload:
+    __slots__ = ("body", "gzipped", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        # mtime=0: однаковий вміст — однаковий gzip, тож стиснута версія теж стабільна між запусками
+        self.gzipped = gzip.compress(body, 9, mtime=0)
+        self.etag = hashlib.sha256(body).hexdigest()[:HASH_CHARS]
+
+
+class SubmitError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class WebSubmission(NamedTuple):
+    tenant: Tenant
+    user: WebAppUser
+    category: str
+    questions: Sequence[Question]
+    masks: List[int]
+
+
+class WebQuiz:
+    def __init__(self, token: str, tenants: TenantRegistry, quiz_size: int,
+                 on_submit: Callable[[WebSubmission], Awaitable[Dict[str, Any]]]):
+        self.token = token
+        self.tenants = tenants
+        self.quiz_size = quiz_size
+        self.on_submit = on_submit
+        # Цикл подій бота: HTTP-сервер живе в своєму потоці і передає туди зарахування результату
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.page = Payload(PAGE.encode())
+        self._banks: Dict[str, Payload] = {}
+        # Повторна відправка тієї самої спроби (подвійне натискання, обрив зв'язку) чекає на те саме зарахування.
+        # Зберігаємо future, а не результат: після тайм-ауту корутина ще працює, і повтор не має запустити другу
+        self._results: Dict[Tuple[str, str], Tuple[float, concurrent.futures.Future]] = {}
+        self._lock = threading.Lock()
+        self._link_key = hmac.new(b"WebQuizLink", token.encode(), hashlib.sha256).digest()
+
+    def link_token(self, tenant_id: str) -> str:
+        # Орендар приходить з URL, тож підписуємо його, щоб результат не можна було записати в чужий журнал
+        return hmac.new(self._link_key, tenant_id.encode(), hashlib.sha256).hexdigest()[:HASH_CHARS]
+
+    def authorized(self, tenant_id: str, link: str) -> bool:
+        return tenant_id in self.tenants.tenants and hmac.compare_digest(link.encode(), self.link_token(tenant_id).encode())
+
+    def questions(self, tenant: Tenant, category: str) -> Sequence[Question]:
+        return tenant.sections[category][:self.quiz_size]
+
+    def bank(self, tenant_id: str) -> Optional[Payload]:
+        with self._lock:
+            payload = self._banks.get(tenant_id)
+            if payload is None:
+                tenant = self.tenants.tenants.get(tenant_id)
+                if tenant is None:
+                    return None
+                sections = [
+                    {"title": category, "q": [
+                        {"t": q.text, "o": q.labels, "img": q.image} for q in self.questions(tenant, category)
+                    ]}
+                    for category in tenant.sections
+                ]
+                body = json.dumps({"sections": sections}, ensure_ascii=False, separators=(",", ":"))
+                payload = self._banks[tenant_id] = Payload(body.encode())
+            return payload
+
+    def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            tenant_id, link, version = str(request["t"]), str(request["k"]), str(request["v"])
+            section, attempt = int(request["s"]), str(request["n"])
+            masks = [int(mask) for mask in request["a"]]
+            init_data = str(request["initData"])
+        except (KeyError, TypeError, ValueError):
+            raise SubmitError("Некоректний запит")
+
+        if not self.authorized(tenant_id, link):
+            raise SubmitError("Недійсне посилання", 403)
+        tenant = self.tenants.tenants[tenant_id]
+        try:
+            init = safe_parse_webapp_init_data(self.token, init_data)
+        except ValueError:
+            raise SubmitError("Недійсний підпис Telegram", 403)
+        if init.user is None or time.time() - init.auth_date.timestamp() > INIT_DATA_MAX_AGE:
+            raise SubmitError("Сесія застаріла, відкрий тест заново", 403)
+
+        bank = self.bank(tenant_id)
+        categories = list(tenant.sections)
+        if version != bank.etag or not 0 <= section < len(categories):
+            raise SubmitError("Питання змінились, відкрий тест заново", 409)
+        category = categories[section]
+        questions = self.questions(tenant, category)
+        if len(masks) != len(questions) or any(not 0 <= mask < 1 << len(q.labels) for q, mask in zip(questions, masks)):
+            raise SubmitError("Некоректні відповіді")
+
+        key = (init.hash, attempt)
+        with self._lock:
+            self._prune()
+            entry = self._results.get(key)
+            if entry is None:
+                future = asyncio.run_coroutine_threadsafe(
+                    self.on_submit(WebSubmission(tenant, init.user, category, questions, masks)), self.loop
+                )
+                entry = self._results[key] = (init.auth_date.timestamp(), future)
+        try:
+            return entry[1].result(SUBMIT_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            raise SubmitError("Бот зайнятий, спробуй ще раз", 503)
+        except Exception:
+            # Зарахування впало — повтор має спробувати ще раз, а не отримати ту саму помилку
+            with self._lock:
+                if self._results.get(key) is entry:
+                    del self._results[key]
+            raise
+
+    def _prune(self) -> None:
+        expired = time.time() - INIT_DATA_MAX_AGE
+        for key in [key for key, (auth_date, _) in self._results.items() if auth_date < expired]:
+            del self._results[key]
+
+
+PAGE = """<!DOCTYPE html>
+<html lang="uk">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Тест</title>
+<script src="https://telegram.org/js/telegram-web-app.js"></script>
+<style>
+body{font-family:system-ui,sans-serif;margin:0;padding:16px;background:var(--tg-theme-bg-color,#fff);color:var(--tg-theme-text-color,#222)}
+#p{opacity:.6;font-size:14px}#q{font-size:17px;margin:16px 0;white-space:pre-wrap}img{max-width:100%;border-radius:8px}
+button{display:block;width:100%;margin:6px 0;padding:12px;font-size:15px;text-align:left;border:1px solid #8884;border-radius:8px;background:none;color:inherit}
+button.on{background:#8883}button.go{text-align:center;background:var(--tg-theme-button-color,#2a7ae2);color:var(--tg-theme-button-text-color,#fff);border:0}
+.d{margin:14px 0;white-space:pre-wrap}
+</style>
+</head>
+<body>
+<div id="p"></div><div id="q"></div><div id="o"></div><div id="a"></div>
+<script>
+const app = Telegram.WebApp;
+const args = new URLSearchParams(location.search);
+const $ = id => document.getElementById(id);
+let bank, section, questions, i, mask, masks, pending;
+app.ready();
+
+function button(text, cls, onclick) {
+  const b = document.createElement("button");
+  b.textContent = text;
+  b.className = cls;
+  b.onclick = onclick;
+  return b;
+}
+
+function say(text) {
+  $("p").textContent = "";
+  $("q").textContent = text;
+  $("o").replaceChildren();
+  $("a").replaceChildren();
+}
+
+function menu() {
+  say("Вибери розділ для тесту:");
+  $("o").replaceChildren(...bank.sections.map((s, n) => button(s.title, "", () => start(n))));
+}
+
+function start(n) {
+  section = n;
+  questions = bank.sections[n].q;
+  i = 0;
+  masks = [];
+  show();
+}
+
+function show() {
+  const q = questions[i];
+  const order = q.o.map((label, bit) => [bit, label]).sort(() => Math.random() - .5);
+  mask = 0;
+  $("p").textContent = `${bank.sections[section].title} · питання ${i + 1} з ${questions.length}`;
+  $("q").replaceChildren();
+  if (q.img) {
+    const img = document.createElement("img");
+    img.src = "media/" + q.img;
+    $("q").append(img, "\\n");
+  }
+  $("q").append(q.t);
+  $("o").replaceChildren(...order.map(([bit, label]) => button("◻️ " + label, "", e => {
+    mask ^= 1 << bit;
+    e.target.className = mask >> bit & 1 ? "on" : "";
+    e.target.textContent = (mask >> bit & 1 ? "✅ " : "◻️ ") + label;
+  })));
+  $("a").replaceChildren(button("✅ Підтвердити", "go", () => {
+    masks.push(mask);
+    if (++i < questions.length) return show();
+    // Той самий номер спроби при повторі: сервер не зарахує її двічі
+    pending = {initData: app.initData, t: args.get("t"), k: args.get("k"), v: args.get("v"), s: section, a: masks,
+               n: Date.now().toString(36) + Math.random().toString(36).slice(2)};
+    submit();
+  }));
+}
+
+async function submit() {
+  say("⏳ Надсилаю відповіді…");
+  let response;
+  try {
+    response = await fetch("api/submit", {method: "POST", headers: {"Content-Type": "application/json"}, body: JSON.stringify(pending)});
+  } catch (e) {
+    say("📶 Немає зв'язку. Відповіді збережено — спробуй ще раз.");
+    $("a").replaceChildren(button("🔁 Надіслати ще раз", "go", submit));
+    return;
+  }
+  const result = await response.json();
+  if (!response.ok) return say("⚠️ " + result.error);
+  say(`📊 Правильних відповідей: ${result.correct} з ${result.total}\\n📈 Успішність: ${result.percent}%` +
+      (result.valid_until ? `\\n🎓 Тест зараховано до: ${result.valid_until}` : ""));
+  for (const [index, correct] of result.mistakes) {
+    const q = questions[index];
+    const d = document.createElement("div");
+    d.className = "d";
+    d.textContent = `❌ ${q.t}\\nТвоя відповідь: ${labels(q, masks[index])}\\nПравильна відповідь: ${labels(q, correct)}`;
+    $("o").append(d);
+  }
+  $("a").replaceChildren(button("🔁 Інший тест", "go", menu), button("Закрити", "", () => app.close()));
+}
+
+function labels(q, m) {
+  return q.o.filter((_, bit) => m >> bit & 1).join(", ") || "—";
+}
+
+fetch(`api/bank/${encodeURIComponent(args.get("t"))}?v=${args.get("v")}&k=${args.get("k")}`)
+  .then(r => r.json())
+  .then(data => { bank = data; menu(); })
+  .catch(() => say("📶 Не вдалося завантажити питання."));
+</script>
+</body>
+</html>
+"""